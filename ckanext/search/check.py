@@ -0,0 +1,236 @@
+"""
+Reconciliation of the search index with the database.
+
+The records in the database and in the index are streamed sorted by id and
+compared in a single pass, so memory use does not depend on the number of
+records. Records missing from the index or with a different modification
+date are reindexed, and records in the index that no longer exist in the
+database are removed.
+"""
+import datetime
+import logging
+import re
+from collections.abc import Iterable, Iterator
+from typing import Any, Optional
+
+from sqlalchemy import collate
+
+from ckan import model
+from ckan.plugins import PluginImplementations, SingletonPlugin
+
+from ckanext.search import index
+from ckanext.search.interfaces import ISearchFeature
+
+
+log = logging.getLogger(__name__)
+
+MISSING = "missing"
+STALE = "stale"
+ORPHAN = "orphan"
+
+
+def get_entity_types() -> list[str]:
+    """
+    Return the core entity types plus the ones managed by ISearchFeature
+    plugins
+    """
+    entity_types = ["dataset", "organization"]
+    for plugin in PluginImplementations(ISearchFeature):
+        for entity_type in plugin.entity_types() or []:
+            if entity_type not in entity_types:
+                entity_types.append(entity_type)
+
+    return entity_types
+
+
+def _get_feature_plugin(entity_type: str) -> Optional[SingletonPlugin]:
+
+    if entity_type in ("dataset", "organization"):
+        return None
+
+    for plugin in PluginImplementations(ISearchFeature):
+        if entity_type in (plugin.entity_types() or []):
+            return plugin
+
+    raise ValueError(f"Unknown entity type: {entity_type}")
+
+
+def parse_iso_datetime(value: str) -> datetime.datetime:
+    """
+    Parse an ISO 8601 timestamp. Raises ValueError if it's not valid
+    """
+    # Before Python 3.11 fromisoformat() doesn't support the Z suffix, or
+    # fractions that are not 3 or 6 digits long (Solr drops trailing zeros)
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    value = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), value)
+
+    return datetime.datetime.fromisoformat(value)
+
+
+def _normalize_modified(value: Any) -> Optional[datetime.datetime]:
+    """
+    Parse modification dates coming from the database or the index into
+    naive UTC datetimes with millisecond precision (the one Solr stores)
+    """
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = parse_iso_datetime(value)
+    if value.tzinfo:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _database_records(
+    entity_type: str,
+) -> Iterator[tuple[str, Optional[datetime.datetime]]]:
+    """
+    Yield (id, metadata_modified) tuples for all records of the entity type
+    that should be in the index, sorted by id in binary order
+    """
+    feature_plugin = _get_feature_plugin(entity_type)
+    if feature_plugin:
+        # Unsorted ids would be reported as missing and orphaned
+        last_id = None
+        for id_ in feature_plugin.existing_record_ids(entity_type) or []:
+            if last_id is not None and id_ <= last_id:
+                raise ValueError(
+                    f"Ids of {entity_type} records are not sorted in binary order"
+                )
+            last_id = id_
+            yield id_, None
+        return
+
+    if entity_type == "dataset":
+        query = index._dataset_ids_query().add_columns(
+            model.Package.metadata_modified
+        )
+        column = model.Package.id
+    else:
+        query = index._organization_ids_query()
+        column = model.Group.id
+
+    # Binary collation to get the same order as the search index, streaming
+    # the rows from the server rather than loading them all
+    query = query.order_by(collate(column, "C")).yield_per(
+        index._get_indexing_batch_size()
+    )
+    for row in query:
+        yield row[0], (_normalize_modified(row[1]) if len(row) > 1 else None)
+
+
+def diff_records(
+    db_records: Iterable[tuple[str, Optional[datetime.datetime]]],
+    index_records: Iterable[tuple[str, Optional[datetime.datetime]]],
+) -> Iterator[tuple[str, str]]:
+    """
+    Merge two streams of (id, metadata_modified) tuples sorted by id, and
+    yield (id, status) tuples for the records that differ, where status is
+    one of MISSING, STALE or ORPHAN
+    """
+    db_iter = iter(db_records)
+    index_iter = iter(index_records)
+    db_record = next(db_iter, None)
+    index_record = next(index_iter, None)
+
+    while db_record is not None or index_record is not None:
+        if index_record is None or (
+            db_record is not None and db_record[0] < index_record[0]
+        ):
+            yield db_record[0], MISSING
+            db_record = next(db_iter, None)
+        elif db_record is None or index_record[0] < db_record[0]:
+            yield index_record[0], ORPHAN
+            index_record = next(index_iter, None)
+        else:
+            if db_record[1] is not None and db_record[1] != index_record[1]:
+                yield db_record[0], STALE
+            db_record = next(db_iter, None)
+            index_record = next(index_iter, None)
+
+
+def _reindex(entity_type: str, ids: list[str]) -> list[str]:
+
+    feature_plugin = _get_feature_plugin(entity_type)
+    if not feature_plugin:
+        # The stored hashes can't be trusted for records that are out of sync
+        return index._index_chunk(entity_type, ids, force=True)
+
+    records = {}
+    for data in feature_plugin.fetch_records(entity_type, ids):
+        records[data["id"]] = feature_plugin.format_search_data(entity_type, data)
+    try:
+        index._index_records(entity_type, records, force=True)
+    except Exception:
+        log.error(f"Error indexing {entity_type} records", exc_info=True)
+        return ids
+
+    return []
+
+
+def check_index(
+    entity_type: str, fix: bool = True
+) -> tuple[dict[str, int], list[str]]:
+    """
+    Compare the records of the entity type in the database with the ones in
+    the index of each indexing provider. If `fix` is True, missing and
+    outdated records are reindexed and orphans are removed.
+
+    Returns the number of records found for each status, and the ids of the
+    records that could not be reindexed.
+    """
+    counts = {MISSING: 0, STALE: 0, ORPHAN: 0}
+    failed = []
+    size = index._get_indexing_batch_size()
+
+    for provider_plugin in index._get_indexing_plugins():
+        to_index = []
+        to_delete = []
+
+        indexed_records = provider_plugin.indexed_records(entity_type)
+        if indexed_records is None:
+            log.warning(
+                f"Search provider '{provider_plugin.id}' can't list its indexed "
+                "records, skipping it"
+            )
+            continue
+
+        index_records = (
+            (id_, _normalize_modified(modified))
+            for id_, modified in indexed_records
+        )
+        diff = diff_records(_database_records(entity_type), index_records)
+        for id_, status in diff:
+            counts[status] += 1
+            log.debug(f"{entity_type} {id_} is {status} in {provider_plugin.id}")
+            if not fix:
+                continue
+
+            # Fixes are sent to all indexing providers, so records fixed here
+            # will already be in sync when checking the next provider
+            if status == ORPHAN:
+                to_delete.append(id_)
+                if len(to_delete) >= size:
+                    index._delete_records(entity_type, to_delete)
+                    to_delete = []
+            else:
+                to_index.append(id_)
+                if len(to_index) >= size:
+                    failed.extend(_reindex(entity_type, to_index))
+                    to_index = []
+
+        if to_delete:
+            index._delete_records(entity_type, to_delete)
+        if to_index:
+            failed.extend(_reindex(entity_type, to_index))
+
+    log.info(
+        f"Checked {entity_type} records: {counts[MISSING]} missing, "
+        f"{counts[STALE]} outdated, {counts[ORPHAN]} orphaned"
+    )
+
+    return counts, failed
@@ -1,10 +1,32 @@
+import contextlib
+import datetime
+import time
+
 import click
+from ckan.plugins.toolkit import ValidationError
+
+from ckanext.search import spool
+from ckanext.search.check import (
+    MISSING,
+    ORPHAN,
+    STALE,
+    check_index,
+    get_entity_types,
+    parse_iso_datetime,
+)
 
 from ckanext.search.index import (
     rebuild_dataset_index,
     rebuild_organization_index,
+    rebuild_shadow_index,
+    bulk_indexing,
     clear_index,
+    get_rebuild_watermark,
+    set_rebuild_watermark,
+    retry_failed_records,
 )
+from ckanext.search.jobs import replay_spool
+from ckanext.search.logic.actions import export_records
 from ckanext.search.schema import init_schema
 
 
@@ -14,18 +36,212 @@ def search():
     pass
 
 
+def _parse_timestamp(ctx, param, value: str | None) -> datetime.datetime | None:
+
+    if not value:
+        return None
+    try:
+        timestamp = parse_iso_datetime(value)
+    except ValueError:
+        raise click.BadParameter(f"Invalid ISO 8601 timestamp: {value}")
+
+    # Modification dates are stored as naive UTC datetimes
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return timestamp
+
+
 @search.command()
 @click.argument("entity_type", required=False)
-def rebuild(entity_type: str):
+@click.option(
+    "-w",
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes to index records in parallel",
+)
+@click.option(
+    "--since",
+    callback=_parse_timestamp,
+    help="Only reindex records modified after this ISO 8601 timestamp (UTC) "
+    "(deleted records are removed by `ckan search check`)",
+)
+@click.option(
+    "-i",
+    "--incremental",
+    is_flag=True,
+    help="Only reindex records modified since the last successful full rebuild "
+    "(deleted records are removed by `ckan search check`)",
+)
+@click.option(
+    "-r",
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted rebuild from its last checkpoint",
+)
+@click.option(
+    "--retry-failed",
+    is_flag=True,
+    help="Only reindex the records that failed in the last rebuild",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Reindex records even if they haven't changed since they were indexed",
+)
+@click.option(
+    "--shadow",
+    is_flag=True,
+    help="Rebuild into a new index that replaces the current one when done "
+    "(if supported by the search provider)",
+)
+def rebuild(
+    entity_type: str,
+    workers: int,
+    since: datetime.datetime | None,
+    incremental: bool,
+    resume: bool,
+    retry_failed: bool,
+    force: bool,
+    shadow: bool,
+):
+
+    started = datetime.datetime.utcnow()
+
+    if shadow:
+        if entity_type or since or incremental or resume or retry_failed:
+            raise click.UsageError("--shadow can only be used to rebuild all records")
+
+        try:
+            failed = rebuild_shadow_index(workers=workers)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        _report_failed(failed)
+
+        # Records deleted during the rebuild were only removed from the
+        # previous index
+        for type_ in ("organization", "dataset"):
+            failed += check_index(type_)[1]
+        _report_failed(failed)
+
+        set_rebuild_watermark(started)
+        return
+
+    if retry_failed:
+        failed = []
+        for type_ in [entity_type] if entity_type else ["organization", "dataset"]:
+            failed += retry_failed_records(type_, workers=workers, force=force)
+
+        _report_failed(failed)
+        return
+
+    if incremental and not since:
+        since = get_rebuild_watermark()
+        if since:
+            click.echo(f"Reindexing records modified since {since.isoformat()}")
+        else:
+            click.echo("No previous rebuild found, reindexing all records")
+
+    params = {"workers": workers, "since": since, "resume": resume, "force": force}
+
+    # Only full rebuilds change the index settings, partial ones index too few
+    # records to make up for it
+    bulk = bulk_indexing() if not since else contextlib.nullcontext()
 
-    if entity_type == "dataset":
-        rebuild_dataset_index()
-    elif entity_type == "organization":
-        rebuild_organization_index()
-    elif entity_type is None:
+    failed = []
+    with bulk:
+        if entity_type == "dataset":
+            failed += rebuild_dataset_index(**params)
+        elif entity_type == "organization":
+            failed += rebuild_organization_index(**params)
+        elif entity_type is None:
 
-        rebuild_organization_index()
-        rebuild_dataset_index()
+            failed += rebuild_organization_index(**params)
+            failed += rebuild_dataset_index(**params)
+
+    _report_failed(failed)
+
+    # A resumed rebuild started earlier, so keep the previous watermark. Same
+    # if records modified between the watermark and `since` were skipped
+    if entity_type is None and not resume and _covers_watermark(since):
+        set_rebuild_watermark(started)
+
+
+def _covers_watermark(since: datetime.datetime | None) -> bool:
+
+    if not since:
+        return True
+
+    watermark = get_rebuild_watermark()
+    return watermark is not None and since <= watermark
+
+
+def _report_failed(failed: list[str]) -> None:
+
+    if failed:
+        click.secho(
+            f"{len(failed)} records could not be indexed: {', '.join(failed)}\n"
+            "Run the command with --retry-failed to index them again",
+            fg="red",
+            err=True,
+        )
+        raise click.exceptions.Exit(1)
+
+
+@search.command()
+@click.argument("entity_type", required=False)
+@click.option(
+    "--dry-run", is_flag=True, help="Only report the differences, don't fix them"
+)
+def check(entity_type: str | None, dry_run: bool):
+    """Compare the records in the database with the ones in the search index,
+    reindexing missing or outdated records and removing orphaned ones"""
+    failed = []
+    for et in [entity_type] if entity_type else get_entity_types():
+        try:
+            counts, et_failed = check_index(et, fix=not dry_run)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(
+            f"{et}: {counts[MISSING]} missing, {counts[STALE]} outdated, "
+            f"{counts[ORPHAN]} orphaned"
+        )
+        failed.extend(et_failed)
+
+    if failed:
+        click.secho(
+            f"{len(failed)} records could not be indexed: {', '.join(failed)}",
+            fg="red",
+            err=True,
+        )
+        raise click.exceptions.Exit(1)
+
+
+@search.command()
+@click.option("-q", "--query", help="Text query, e.g. 'water data'")
+@click.option("--filters", help="Filters, as a JSON object")
+@click.option("--sort", help="Sort, e.g. 'metadata_modified desc'")
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the records to (defaults to stdout)",
+)
+def export(query, filters, sort, output):
+    """Export all records matching the query as NDJSON"""
+    data_dict = {"q": query, "filters": filters, "sort": sort}
+    data_dict = {key: value for key, value in data_dict.items() if value}
+
+    try:
+        records = export_records({"ignore_auth": True}, data_dict)
+    except ValidationError as e:
+        raise click.UsageError(str(e.error_dict))
+
+    for record in records:
+        output.write(record)
 
 
 @search.command()
@@ -36,12 +252,38 @@ def clear(force):
         clear_index()
 
 
+@search.command()
+@click.option(
+    "--interval",
+    type=click.IntRange(min=1),
+    help="Keep running, replaying the spool every INTERVAL seconds",
+)
+def replay(interval):
+    """Send the index operations that failed while the search backend
+    was unavailable. The spool is local, in sync mode run it on every web
+    host"""
+    while True:
+        replayed = replay_spool()
+        remaining = spool.count()
+        if replayed or remaining or not interval:
+            click.echo(f"Replayed {replayed} operations, {remaining} remaining")
+        if not interval:
+            break
+        time.sleep(interval)
+
+    if remaining:
+        raise click.exceptions.Exit(1)
+
+
 @search.command()
 @click.option(
     "-p", "--provider", help="Search provider to initialize (e.g. solr)"
 )
-def init(provider):
-    init_schema(provider_id=provider)
+@click.option(
+    "-f", "--force", is_flag=True, help="Initialize even if the schema hasn't changed"
+)
+def init(provider, force):
+    init_schema(provider_id=provider, force=force)
 
 
 def get_commands():
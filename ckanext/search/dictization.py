@@ -0,0 +1,211 @@
+# This will eventually live in ckan/lib/dictization/model_dictize.py
+"""
+Batch versions of package_dictize and package_show used for indexing.
+
+They produce the same dicts as the core functions but load the data for a
+whole chunk of datasets with a fixed number of queries, instead of issuing
+a set of queries for each dataset.
+"""
+from collections import defaultdict
+from collections.abc import Iterable
+from typing import Any
+
+from sqlalchemy import false, select
+
+from ckan import model
+from ckan.lib import dictization as d
+from ckan.lib import plugins as lib_plugins
+from ckan.lib.dictization import model_dictize
+from ckan.plugins import IPackageController, IResourceController, PluginImplementations
+from ckan.types import Context
+
+
+def _group_rows(rows: Iterable[Any], key: str) -> dict[str, list[Any]]:
+
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[getattr(row, key)].append(row)
+
+    return grouped
+
+
+def package_dictize_batch(
+    packages: list[model.Package], context: Context
+) -> list[dict[str, Any]]:
+    """
+    Given a list of Package objects, returns the equivalent dictionaries, as
+    returned by package_dictize()
+    """
+    ids = [pkg.id for pkg in packages]
+    execute = model.Session.execute
+
+    # resources
+    res = model.resource_table
+    q = select(res).where(res.c["package_id"].in_(ids))
+    resources = _group_rows(execute(q), "package_id")
+
+    # tags
+    tag = model.tag_table
+    pkg_tag = model.package_tag_table
+    q = (
+        select(tag, pkg_tag.c["state"], pkg_tag.c["package_id"])
+        .select_from(pkg_tag.join(tag, tag.c["id"] == pkg_tag.c["tag_id"]))
+        .where(pkg_tag.c["package_id"].in_(ids))
+    )
+    tags = _group_rows(execute(q), "package_id")
+
+    # extras
+    extras = {}
+    if hasattr(model, "package_extra_table"):
+        extra = model.package_extra_table
+        q = select(extra).where(extra.c["package_id"].in_(ids))
+        extras = _group_rows(execute(q), "package_id")
+
+    # groups
+    member = model.member_table
+    group = model.group_table
+    q = (
+        select(group, member.c["capacity"], member.c["table_id"])
+        .select_from(member.join(group, member.c["group_id"] == group.c["id"]))
+        .where(member.c["table_id"].in_(ids))
+        .where(member.c["state"] == "active")
+        .where(group.c["is_organization"] == false())
+    )
+    groups = _group_rows(execute(q), "table_id")
+
+    # owning organizations
+    org_ids = {pkg.owner_org for pkg in packages if pkg.owner_org}
+    organizations = {}
+    if org_ids:
+        q = (
+            select(group)
+            .where(group.c["id"].in_(org_ids))
+            .where(group.c["state"] == "active")
+        )
+        organizations = {
+            org["id"]: org for org in d.obj_list_dictize(execute(q), context)
+        }
+
+    # relations
+    rel = model.package_relationship_table
+    q = select(rel).where(rel.c["subject_package_id"].in_(ids))
+    relationships_as_subject = _group_rows(execute(q), "subject_package_id")
+    q = select(rel).where(rel.c["object_package_id"].in_(ids))
+    relationships_as_object = _group_rows(execute(q), "object_package_id")
+
+    results = []
+    for pkg in packages:
+        result_dict = d.table_dictize(pkg, context)
+        # strip whitespace from title
+        if result_dict.get("title"):
+            result_dict["title"] = result_dict["title"].strip()
+
+        result_dict.pop("plugin_data", None)
+
+        result_dict["resources"] = model_dictize.resource_list_dictize(
+            resources[pkg.id], context
+        )
+        result_dict["num_resources"] = len(result_dict["resources"])
+
+        result_dict["tags"] = d.obj_list_dictize(
+            tags[pkg.id], context, lambda x: x["name"]
+        )
+        for tag_dict in result_dict["tags"]:
+            tag_dict.pop("package_id")
+            tag_dict["display_name"] = tag_dict["name"]
+        result_dict["num_tags"] = len(result_dict["tags"])
+
+        if hasattr(model, "package_extra_table"):
+            result_dict["extras"] = model_dictize.extras_list_dictize(
+                extras[pkg.id], context
+            )
+        else:
+            # Newer versions of CKAN store extras in the package table
+            result_dict["extras"] = [
+                {"key": key, "value": value}
+                for key, value in sorted(pkg.extras.items())
+            ]
+
+        # no package counts as cannot fetch from search index at the same
+        # time as indexing to it.
+        result_dict["groups"] = model_dictize.group_list_dictize(
+            groups[pkg.id],
+            dict(context, with_capacity=False),
+            with_package_counts=False,
+        )
+        for group_dict in result_dict["groups"]:
+            group_dict.pop("table_id")
+
+        result_dict["organization"] = organizations.get(pkg.owner_org)
+
+        result_dict["relationships_as_subject"] = d.obj_list_dictize(
+            relationships_as_subject[pkg.id], context
+        )
+        result_dict["relationships_as_object"] = d.obj_list_dictize(
+            relationships_as_object[pkg.id], context
+        )
+
+        # Extra properties from the domain object
+        result_dict["isopen"] = (
+            pkg.isopen if isinstance(pkg.isopen, bool) else pkg.isopen()
+        )
+
+        # if null assign the default value to make searching easier
+        result_dict["type"] = pkg.type or "dataset"
+
+        if pkg.license and pkg.license.url:
+            result_dict["license_url"] = pkg.license.url
+            result_dict["license_title"] = pkg.license.title.split("::")[-1]
+        elif pkg.license:
+            result_dict["license_title"] = pkg.license.title
+        else:
+            result_dict["license_title"] = pkg.license_id
+
+        result_dict["metadata_modified"] = pkg.metadata_modified.isoformat()
+        result_dict["metadata_created"] = (
+            pkg.metadata_created.isoformat() if pkg.metadata_created else None
+        )
+
+        results.append(result_dict)
+
+    return results
+
+
+def show_datasets(ids: list[str], context: Context) -> list[dict[str, Any]]:
+    """
+    Return the validated dicts for the datasets with the provided ids, as
+    returned by package_show(). Ids not found are ignored.
+    """
+    context = dict(context, model=model, session=model.Session)
+
+    packages = {
+        pkg.id: pkg
+        for pkg in model.Session.query(model.Package).filter(
+            model.Package.id.in_(ids)
+        )
+    }
+    packages = [packages[id_] for id_ in ids if id_ in packages]
+
+    dataset_dicts = []
+    for pkg, dataset_dict in zip(
+        packages, package_dictize_batch(packages, context)
+    ):
+        pkg_context = dict(context, package=pkg)
+
+        for item in PluginImplementations(IResourceController):
+            for resource_dict in dataset_dict["resources"]:
+                item.before_resource_show(resource_dict)
+
+        package_plugin = lib_plugins.lookup_package_plugin(dataset_dict["type"])
+        schema = package_plugin.show_package_schema()
+        if schema and pkg_context.get("validate", True):
+            dataset_dict, errors = lib_plugins.plugin_validate(
+                package_plugin, pkg_context, dataset_dict, schema, "package_show"
+            )
+
+        for item in PluginImplementations(IPackageController):
+            item.after_dataset_show(pkg_context, dataset_dict)
+
+        dataset_dicts.append(dataset_dict)
+
+    return dataset_dicts
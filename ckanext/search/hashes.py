@@ -0,0 +1,89 @@
+"""
+Local SQLite table with the content hash of the last version of each record
+sent to each search provider, used to skip writes of records that haven't
+changed when the ckan.search.skip_unchanged config option is enabled.
+
+The hash is also stored in the `content_hash` field of the indexed records.
+"""
+import hashlib
+import json
+import sqlite3
+from contextlib import closing
+from typing import Any
+
+from ckanext.search.storage import get_storage_path
+
+
+# Keep queries under SQLite's limit of host parameters
+_MAX_PARAMS = 500
+
+
+def _connect() -> sqlite3.Connection:
+
+    conn = sqlite3.connect(get_storage_path("hashes.db"), timeout=30)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS hashes (
+            provider TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            id TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (provider, entity_type, id)
+        )
+        """
+    )
+    return conn
+
+
+def get_content_hash(search_data: dict[str, Any]) -> str:
+    """
+    Return a stable hash of the search data of a record
+    """
+    data = json.dumps(search_data, sort_keys=True, default=str)
+
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def load(provider_id: str, entity_type: str, ids: list[str]) -> dict[str, str]:
+    """
+    Return the stored hashes for the provided record ids. Records without
+    one are not included.
+    """
+    hashes = {}
+    with closing(_connect()) as conn:
+        for i in range(0, len(ids), _MAX_PARAMS):
+            chunk = ids[i : i + _MAX_PARAMS]
+            rows = conn.execute(
+                "SELECT id, hash FROM hashes WHERE provider = ? AND entity_type = ? "
+                f"AND id IN ({', '.join('?' * len(chunk))})",
+                [provider_id, entity_type] + chunk,
+            )
+            hashes.update(rows)
+
+    return hashes
+
+
+def save(provider_id: str, entity_type: str, hashes: dict[str, str]) -> None:
+
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)",
+            [(provider_id, entity_type, id_, hash_) for id_, hash_ in hashes.items()],
+        )
+
+
+def remove(entity_type: str, ids: list[str]) -> None:
+    """
+    Remove the hashes of the provided records for all providers
+    """
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "DELETE FROM hashes WHERE entity_type = ? AND id = ?",
+            [(entity_type, id_) for id_ in ids],
+        )
+
+
+def clear(provider_id: str) -> None:
+
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM hashes WHERE provider = ?", (provider_id,))
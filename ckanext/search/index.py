@@ -1,50 +1,167 @@
+import collections
+import contextlib
+import copy
+import datetime
+import functools
 import json
-from collections.abc import Iterator
+import logging
+import multiprocessing
+from collections.abc import Iterable, Iterator
+from typing import Any, Optional
 
+from sqlalchemy.orm import Query
 from sqlalchemy.sql.expression import true
 
 from ckan import model
 from ckan.lib.navl.dictization_functions import MissingNullEncoder
 from ckan.lib.plugins import get_permission_labels
+from ckan.model.system_info import get_system_info, set_system_info
 from ckan.plugins import PluginImplementations, SingletonPlugin
-from ckan.plugins.toolkit import aslist, config, get_action
-from ckan.types import ActionResult
+from ckan.plugins.toolkit import asbool, asint, aslist, config, get_action
+from ckan.types import ActionResult, Context
 
+from ckanext.search import hashes
+from ckanext.search.dictization import show_datasets
 from ckanext.search.interfaces import ISearchProvider, ISearchFeature
 from ckanext.search.schema import get_search_schema
+from ckanext.search.storage import clear_checkpoint, load_checkpoint, save_checkpoint
 
 
-def _get_indexing_providers() -> list:
+log = logging.getLogger(__name__)
+
+# system_info key storing the start time of the last successful full rebuild
+REBUILD_WATERMARK_KEY = "ckan.search.rebuild_watermark"
+
+
+# The functions below are called for every indexed record, so their results
+# are cached until the plugins are reloaded (see `clear_caches()`)
+
+
+@functools.cache
+def _get_indexing_providers() -> tuple[str, ...]:
     indexing_providers = aslist(
         config.get(
-            "ckan.search.indexing_provider", config["ckan.search.search_provider"]
+            "ckan.search.indexing_provider", config.get("ckan.search.search_provider")
         )
     )
 
-    return indexing_providers
+    return tuple(indexing_providers)
+
 
+@functools.cache
+def _get_indexing_plugins() -> tuple[SingletonPlugin, ...]:
+    return tuple(
+        plugin
+        for plugin in PluginImplementations(ISearchProvider)
+        if plugin.id in _get_indexing_providers()
+    )
 
-def _get_indexing_plugins() -> Iterator[SingletonPlugin]:
-    for plugin in PluginImplementations(ISearchProvider):
-        if plugin.id in _get_indexing_providers():
-            yield plugin
 
+@functools.cache
+def _get_feature_plugins(
+    provider_id: str, entity_type: str
+) -> tuple[SingletonPlugin, ...]:
+    """
+    Return the ISearchFeature plugins that support both the provider and the
+    entity type
+    """
+    return tuple(
+        plugin
+        for plugin in PluginImplementations(ISearchFeature)
+        if provider_id in plugin.supported_providers()
+        and entity_type in plugin.entity_types()
+    )
 
-def index_dataset(id_: str) -> None:
 
-    context = {
+def clear_caches() -> None:
+    """
+    Clear the cached search schema and plugin lists. Called when the plugins
+    are (re)loaded
+    """
+    get_search_schema.cache_clear()
+    _get_indexing_providers.cache_clear()
+    _get_indexing_plugins.cache_clear()
+    _get_feature_plugins.cache_clear()
+
+
+def _get_indexing_batch_size() -> int:
+    return asint(config.get("ckan.search.indexing_batch_size", 100))
+
+
+def _get_skip_unchanged() -> bool:
+    return asbool(config.get("ckan.search.skip_unchanged", False))
+
+
+def _get_show_context() -> Context:
+    return {
         "ignore_auth": True,
         "use_cache": False,
         # "for_indexing": True,  # TODO: implement support in core?
     }
 
-    # Request the validated dataset
-    dataset_dict = get_action("package_show")(context, {"id": id_})
 
-    return index_dataset_dict(dataset_dict)
+def index_dataset(id_: str, force: bool = False) -> None:
+
+    return index_datasets([id_], force)
 
 
-def index_dataset_dict(dataset_dict: ActionResult.PackageShow) -> None:
+def index_datasets(ids: Iterable[str], force: bool = False) -> None:
+
+    # Request the validated datasets, loaded in bulk rather than calling
+    # package_show for each one
+    dataset_dicts = show_datasets(list(ids), _get_show_context())
+
+    return index_dataset_dicts(dataset_dicts, force)
+
+
+def index_dataset_dict(
+    dataset_dict: ActionResult.PackageShow, force: bool = False
+) -> None:
+
+    return index_dataset_dicts([dataset_dict], force)
+
+
+def index_dataset_dicts(
+    dataset_dicts: Iterable[ActionResult.PackageShow], force: bool = False
+) -> None:
+
+    dataset_dicts = list(dataset_dicts)
+    permission_labels = _get_dataset_permission_labels(
+        [dataset_dict["id"] for dataset_dict in dataset_dicts]
+    )
+
+    records = {}
+    for dataset_dict in dataset_dicts:
+        search_data = _get_dataset_search_data(
+            dataset_dict, permission_labels.get(dataset_dict["id"], [])
+        )
+        records[search_data["id"]] = search_data
+
+    _index_records("dataset", records, force)
+
+
+def _get_dataset_permission_labels(ids: list[str]) -> dict[str, list[str]]:
+    """
+    Return the permission labels of each of the provided dataset ids, as
+    computed by the IPermissionLabels plugin in use. All datasets are loaded
+    with a single query.
+    """
+    if not ids:
+        return {}
+
+    labels = get_permission_labels()
+
+    return {
+        pkg.id: labels.get_dataset_labels(pkg)
+        for pkg in model.Session.query(model.Package).filter(
+            model.Package.id.in_(ids)
+        )
+    }
+
+
+def _get_dataset_search_data(
+    dataset_dict: ActionResult.PackageShow, permission_labels: list[str]
+) -> dict:
 
     # TODO: choose what to index here?
     search_data = {}
@@ -67,26 +184,47 @@ def index_dataset_dict(dataset_dict: ActionResult.PackageShow) -> None:
 
     # permission labels determine visibility in search, can't be set
     # in original dataset or before_dataset_index plugins
-    id_ = dataset_dict["id"]
-    labels = get_permission_labels()
-    search_data["permission_labels"] = labels.get_dataset_labels(model.Package.get(id_))
+    search_data["permission_labels"] = permission_labels
 
-    _index_record("dataset", search_data["id"], search_data)
+    return search_data
 
 
-def index_organization(id_: str) -> None:
+def index_organization(id_: str, force: bool = False) -> None:
+
+    return index_organizations([id_], force)
+
+
+def index_organizations(ids: Iterable[str], force: bool = False) -> None:
+
+    # TODO: "use_cache" not really used in core outside datasets
+    org_dicts = [
+        get_action("organization_show")(_get_show_context(), {"id": id_})
+        for id_ in ids
+    ]
+
+    return index_organization_dicts(org_dicts, force)
 
-    context = {
-        "ignore_auth": True,
-        "use_cache": False,  # TODO: not really used in core outside datasets
-        # "for_indexing": True,  # TODO: implement support in core
-    }
-    org_dict = get_action("organization_show")(context, {"id": id_})
 
-    return index_organization_dict(org_dict)
+def index_organization_dict(
+    org_dict: ActionResult.OrganizationShow, force: bool = False
+) -> None:
 
+    return index_organization_dicts([org_dict], force)
 
-def index_organization_dict(org_dict: ActionResult.OrganizationShow) -> None:
+
+def index_organization_dicts(
+    org_dicts: Iterable[ActionResult.OrganizationShow], force: bool = False
+) -> None:
+
+    records = {}
+    for org_dict in org_dicts:
+        search_data = _get_organization_search_data(org_dict)
+        records[search_data["id"]] = search_data
+
+    _index_records("organization", records, force)
+
+
+def _get_organization_search_data(org_dict: ActionResult.OrganizationShow) -> dict:
 
     # TODO: choose what to index here?
     search_data = {}
@@ -101,65 +239,534 @@ def index_organization_dict(org_dict: ActionResult.OrganizationShow) -> None:
     search_data["entity_type"] = "organization"
     search_data["validated_data_dict"] = json.dumps(search_data, cls=MissingNullEncoder)
 
-    _index_record("organization", search_data["id"], search_data)
+    return search_data
+
+
+def _index_records(
+    entity_type: str, original_records: dict[str, dict], force: bool = False
+) -> None:
+    """
+    Send the records to the indexing providers, after running the
+    before_index hooks of the search features.
 
+    If ckan.search.skip_unchanged is enabled, records whose content hash
+    matches the one stored locally for the provider are not sent again,
+    unless `force` is True.
+    """
 
-def _index_record(entity_type: str, id_: str, search_data: dict) -> None:
+    if not original_records:
+        return
 
     search_schema = get_search_schema()
 
-    for provider_plugin in PluginImplementations(ISearchProvider):
-        if provider_plugin.id in _get_indexing_providers():
+    for provider_plugin in _get_indexing_plugins():
 
-            for feature_plugin in PluginImplementations(ISearchFeature):
-                provider_supported = (
-                    provider_plugin.id in feature_plugin.supported_providers()
+        # Hooks and providers modify the records, so each provider gets its
+        # own copy. Otherwise hashes would depend on the other providers
+        records = copy.deepcopy(original_records)
+
+        for feature_plugin in _get_feature_plugins(provider_plugin.id, entity_type):
+            for id_, search_data in records.items():
+                feature_plugin.before_index(
+                    entity_type, id_, search_data, search_schema
                 )
-                entity_type_supported = entity_type in feature_plugin.entity_types()
 
-                if provider_supported and entity_type_supported:
+        content_hashes = {
+            id_: hashes.get_content_hash(search_data)
+            for id_, search_data in records.items()
+        }
 
-                    feature_plugin.before_index(
-                        entity_type, id_, search_data, search_schema
-                    )
+        changed = records
+        if _get_skip_unchanged() and not force:
+            stored_hashes = hashes.load(
+                provider_plugin.id, entity_type, list(records.keys())
+            )
+            changed = {
+                id_: search_data
+                for id_, search_data in records.items()
+                if stored_hashes.get(id_) != content_hashes[id_]
+            }
+            if len(changed) < len(records):
+                log.debug(
+                    f"Skipping {len(records) - len(changed)} unchanged "
+                    f"{entity_type} records for {provider_plugin.id}"
+                )
+            if not changed:
+                continue
 
-            provider_plugin.index_search_record(
-                entity_type, id_, search_data, search_schema
+        for id_, search_data in changed.items():
+            search_data["content_hash"] = content_hashes[id_]
+
+        provider_plugin.index_search_records(entity_type, changed, search_schema)
+
+        # Only stored once the provider accepted the records
+        if _get_skip_unchanged():
+            hashes.save(
+                provider_plugin.id,
+                entity_type,
+                {id_: content_hashes[id_] for id_ in changed},
             )
 
 
-def rebuild_dataset_index() -> None:
+@contextlib.contextmanager
+def bulk_indexing() -> Iterator[None]:
+    """
+    Context manager that lets the indexing providers know that a large number
+    of records is going to be indexed, e.g. to defer commits until the end.
+    """
+    plugins = list(_get_indexing_plugins())
 
-    dataset_ids = [
-        r[0]
-        for r in model.Session.query(model.Package.id)
-        .filter(
-            model.Package.state != "deleted"
-        )  # TODO: more filters (state, type, etc)?
-        .all()
-    ]
+    for plugin in plugins:
+        plugin.begin_bulk_indexing()
+    try:
+        yield
+    finally:
+        for plugin in plugins:
+            plugin.end_bulk_indexing()
 
-    for id_ in dataset_ids:
-        index_dataset(id_)
 
+def delete_dataset(id_: str) -> None:
 
-def rebuild_organization_index() -> None:
+    return delete_datasets([id_])
 
-    org_ids = [
-        r[0]
-        for r in model.Session.query(model.Group.id)
-        .filter(
-            model.Group.state != "deleted"
-        )  # TODO: more filters (state, type, etc)?
+
+def delete_datasets(ids: Iterable[str]) -> None:
+
+    _delete_records("dataset", list(ids))
+
+
+def delete_organization(id_: str) -> None:
+
+    return delete_organizations([id_])
+
+
+def delete_organizations(ids: Iterable[str]) -> None:
+
+    _delete_records("organization", list(ids))
+
+
+def _delete_records(entity_type: str, ids: list[str]) -> None:
+
+    if not ids:
+        return
+
+    for provider_plugin in _get_indexing_plugins():
+        provider_plugin.delete_search_records(entity_type, ids)
+
+    if _get_skip_unchanged():
+        hashes.remove(entity_type, ids)
+
+
+def _iter_id_chunks(
+    query: Query, column: Any, size: int, start_after: Optional[str] = None
+) -> Iterator[list[str]]:
+    """
+    Yield the ids returned by the query in chunks of the given size, starting
+    after the `start_after` id if provided.
+
+    Uses keyset pagination on the id column, so only one chunk of ids is held
+    in memory at a time and the first chunk is available right away.
+    """
+    last_id = start_after
+    while True:
+        chunk_query = query
+        if last_id is not None:
+            chunk_query = chunk_query.filter(column > last_id)
+
+        ids = [r[0] for r in chunk_query.order_by(column).limit(size)]
+        if not ids:
+            return
+
+        yield ids
+
+        if len(ids) < size:
+            return
+        last_id = ids[-1]
+
+
+def _dataset_ids_query() -> Query:
+
+    return model.Session.query(model.Package.id).filter(
+        model.Package.state != "deleted"
+    )  # TODO: more filters (state, type, etc)?
+
+
+def _organization_ids_query() -> Query:
+
+    return (
+        model.Session.query(model.Group.id)
+        .filter(model.Group.state != "deleted")  # TODO: more filters (type, etc)?
         .filter(model.Group.is_organization == true())
-        .all()
-    ]
+    )
+
+
+def index_entities(entity_type: str, ids: list[str], force: bool = False) -> None:
+    """
+    Index the records of the given entity type with the provided ids.
+    Records that have been deleted or purged in the meantime are removed
+    from the index instead.
+    """
+    if entity_type == "dataset":
+        query, column = _dataset_ids_query(), model.Package.id
+    elif entity_type == "organization":
+        query, column = _organization_ids_query(), model.Group.id
+    else:
+        raise ValueError(f"Unknown entity type: {entity_type}")
+
+    existing = {row[0] for row in query.filter(column.in_(ids))}
+    if deleted := [id_ for id_ in ids if id_ not in existing]:
+        delete_entities(entity_type, deleted)
+
+    ids = [id_ for id_ in ids if id_ in existing]
+    if not ids:
+        return
+
+    if entity_type == "dataset":
+        index_datasets(ids, force)
+    else:
+        index_organizations(ids, force)
+
+
+def delete_entities(entity_type: str, ids: list[str]) -> None:
+    """
+    Remove the records of the given entity type with the provided ids from
+    the index
+    """
+    if entity_type == "dataset":
+        delete_datasets(ids)
+    elif entity_type == "organization":
+        delete_organizations(ids)
+    else:
+        raise ValueError(f"Unknown entity type: {entity_type}")
+
+
+def _index_chunk(
+    entity_type: str, ids: list[str], force: bool = False
+) -> list[str]:
+    """
+    Index a chunk of records, returning the ids of the ones that failed.
+
+    If the chunk fails as a whole, records are indexed one by one to find out
+    which ones are the culprits.
+    """
+
+    try:
+        index_entities(entity_type, ids, force)
+        return []
+    except Exception:
+        log.warning(
+            f"Error indexing {entity_type} chunk, retrying records individually",
+            exc_info=True,
+        )
+
+    failed = []
+    for id_ in ids:
+        try:
+            index_entities(entity_type, [id_], force)
+        except Exception:
+            log.error(f"Error indexing {entity_type} {id_}", exc_info=True)
+            failed.append(id_)
+
+    return failed
+
+
+def _init_rebuild_worker() -> None:
+
+    # Database connections inherited from the parent process can't be
+    # shared, drop them without closing them so the worker opens its own.
+    # Provider clients are recreated by the providers themselves.
+    model.meta.engine.dispose(close=False)
+
+
+def _rebuild(
+    entity_type: str,
+    chunks: Iterator[list[str]],
+    workers: int = 1,
+    checkpoint: Optional[dict[str, Any]] = None,
+    force: bool = False,
+) -> list[str]:
+    """
+    Index all chunks of ids, returning the ids that failed.
+
+    If a checkpoint dict is provided, it is updated and saved to disk after
+    each chunk is indexed, so the rebuild can be resumed from that point.
+    Chunks are always committed in order, even when using several workers.
+
+    Full rebuilds should be wrapped in `bulk_indexing()` by the caller, once
+    for all entity types.
+    """
+    failed = checkpoint["failed"] if checkpoint else []
+    total = 0
+
+    def _chunk_done(chunk: list[str], chunk_failed: list[str]) -> None:
+        nonlocal total
+
+        failed.extend(chunk_failed)
+        total += len(chunk)
+        if checkpoint is not None:
+            checkpoint["last_id"] = chunk[-1]
+            save_checkpoint(entity_type, checkpoint)
+
+    if workers > 1:
+        # Release the connection of the parent session before forking
+        model.Session.remove()
+
+        with multiprocessing.get_context("fork").Pool(
+            workers, initializer=_init_rebuild_worker
+        ) as pool:
+
+            # Ids are still read in the parent, with a bounded number of
+            # chunks in flight so they are not all loaded in memory
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(
+                    (
+                        chunk,
+                        pool.apply_async(
+                            _index_chunk, (entity_type, chunk, force)
+                        ),
+                    )
+                )
+
+                if len(pending) >= workers * 2:
+                    done_chunk, result = pending.popleft()
+                    _chunk_done(done_chunk, result.get())
+
+            for done_chunk, result in pending:
+                _chunk_done(done_chunk, result.get())
+    else:
+        for chunk in chunks:
+            _chunk_done(chunk, _index_chunk(entity_type, chunk, force))
+
+    log.info(f"Indexed {total} {entity_type} records")
+    if failed:
+        log.warning(f"{len(failed)} {entity_type} records could not be indexed")
+
+    if checkpoint is not None:
+        if failed:
+            # Keep the failed ids around for --retry-failed
+            checkpoint["completed"] = True
+            save_checkpoint(entity_type, checkpoint)
+        else:
+            clear_checkpoint(entity_type)
+
+    return failed
+
+
+def _get_resume_checkpoint(entity_type: str, resume: bool) -> dict[str, Any]:
+
+    checkpoint = load_checkpoint(entity_type) if resume else None
+
+    if checkpoint and not checkpoint.get("completed"):
+        log.info(
+            f"Resuming {entity_type} rebuild after id {checkpoint['last_id']}, "
+            f"{len(checkpoint['failed'])} failed records so far"
+        )
+        return checkpoint
+
+    if resume:
+        log.info(f"No {entity_type} rebuild to resume, starting from the beginning")
+
+    return {"last_id": None, "failed": [], "since": None}
+
+
+def rebuild_dataset_index(
+    workers: int = 1,
+    since: Optional[datetime.datetime] = None,
+    resume: bool = False,
+    force: bool = False,
+    save_progress: bool = True,
+) -> list[str]:
+    """
+    Reindex all datasets, using the given number of worker processes.
+
+    If `since` is provided, only datasets modified after it are reindexed.
+    Deleted or purged datasets are not looked for, as deleting a dataset
+    doesn't update its modification date. They are removed from the index
+    when deleted, and orphans are left to `ckan search check`.
+
+    Progress is saved to a checkpoint file, unless `save_progress` is False
+    (e.g. when rebuilding into a different index). If `resume` is True and
+    there is an unfinished rebuild, it is continued from the last indexed id.
+
+    If `force` is True, unchanged datasets are sent to the providers even if
+    ckan.search.skip_unchanged is enabled.
+
+    Returns the ids of the datasets that could not be indexed.
+    """
+    checkpoint = _get_resume_checkpoint("dataset", resume and save_progress)
+    if checkpoint["since"]:
+        since = datetime.datetime.fromisoformat(checkpoint["since"])
+    elif since:
+        checkpoint["since"] = since.isoformat()
+
+    query = _dataset_ids_query()
+
+    if since:
+        query = query.filter(model.Package.metadata_modified > since)
+
+    chunks = _iter_id_chunks(
+        query,
+        model.Package.id,
+        _get_indexing_batch_size(),
+        start_after=checkpoint["last_id"],
+    )
+
+    if not save_progress:
+        checkpoint = None
+
+    return _rebuild("dataset", chunks, workers, checkpoint, force)
+
+
+def rebuild_organization_index(
+    workers: int = 1,
+    since: Optional[datetime.datetime] = None,
+    resume: bool = False,
+    force: bool = False,
+    save_progress: bool = True,
+) -> list[str]:
+    """
+    Reindex all organizations, using the given number of worker processes.
+
+    Organizations don't keep track of their modification date, so if `since`
+    is provided all of them are still reindexed. As with datasets, deleted
+    organizations are not removed, that's left to `ckan search check`.
+
+    Progress is saved to a checkpoint file, unless `save_progress` is False
+    (e.g. when rebuilding into a different index). If `resume` is True and
+    there is an unfinished rebuild, it is continued from the last indexed id.
+
+    If `force` is True, unchanged organizations are sent to the providers even
+    if ckan.search.skip_unchanged is enabled.
+
+    Returns the ids of the organizations that could not be indexed.
+    """
+    checkpoint = _get_resume_checkpoint("organization", resume and save_progress)
+    if checkpoint["since"]:
+        since = datetime.datetime.fromisoformat(checkpoint["since"])
+    elif since:
+        checkpoint["since"] = since.isoformat()
+
+    chunks = _iter_id_chunks(
+        _organization_ids_query(),
+        model.Group.id,
+        _get_indexing_batch_size(),
+        start_after=checkpoint["last_id"],
+    )
+
+    if not save_progress:
+        checkpoint = None
+
+    return _rebuild("organization", chunks, workers, checkpoint, force)
+
+
+def retry_failed_records(
+    entity_type: str, workers: int = 1, force: bool = False
+) -> list[str]:
+    """
+    Reindex only the records that failed in the last rebuild of the entity
+    type, as recorded in its checkpoint.
+
+    Returns the ids that still could not be indexed.
+    """
+    checkpoint = load_checkpoint(entity_type)
+    if not checkpoint or not checkpoint["failed"]:
+        log.info(f"No failed {entity_type} records to retry")
+        return []
+
+    ids = checkpoint["failed"]
+    size = _get_indexing_batch_size()
+    chunks = (ids[i : i + size] for i in range(0, len(ids), size))
+
+    failed = _rebuild(entity_type, chunks, workers, force=force)
+
+    # An interrupted rebuild can still be resumed afterwards
+    if failed or not checkpoint.get("completed"):
+        checkpoint["failed"] = failed
+        save_checkpoint(entity_type, checkpoint)
+    else:
+        clear_checkpoint(entity_type)
+
+    return failed
+
+
+def rebuild_shadow_index(workers: int = 1) -> list[str]:
+    """
+    Reindex all records into a new index, for providers that support it,
+    which replaces the current one once the rebuild finishes without errors.
+    Searches keep using the current index in the meantime. Records changed
+    during the rebuild are reindexed again after the swap, but records deleted
+    in the meantime are only removed by `ckan search check`.
+
+    Returns the ids of the records that could not be indexed. If there are
+    any, the new index is discarded.
+
+    Raises ValueError if search features index other entity types, as their
+    records would be missing from the new index.
+    """
+    started = datetime.datetime.utcnow()
+    plugins = list(_get_indexing_plugins())
+
+    # TODO: index entity types from ISearchFeature plugins with fetch_records
+    feature_entity_types = {
+        entity_type
+        for feature_plugin in PluginImplementations(ISearchFeature)
+        if any(p.id in feature_plugin.supported_providers() for p in plugins)
+        for entity_type in feature_plugin.entity_types() or []
+        if entity_type not in ("dataset", "organization")
+    }
+    if feature_entity_types:
+        raise ValueError(
+            "Shadow rebuilds don't support entity types from search features: "
+            + ", ".join(sorted(feature_entity_types))
+        )
+
+    for plugin in plugins:
+        plugin.begin_shadow_rebuild()
+
+    failed = []
+    completed = False
+    try:
+        # The stored hashes refer to the current index. No checkpoints either,
+        # as they would be resumed or retried against the current index
+        params = {"workers": workers, "force": True, "save_progress": False}
+        with bulk_indexing():
+            failed += rebuild_organization_index(**params)
+            failed += rebuild_dataset_index(**params)
+        completed = True
+    finally:
+        success = completed and not failed
+        for plugin in plugins:
+            plugin.end_shadow_rebuild(success)
+            if not success:
+                hashes.clear(plugin.id)
+
+    if failed:
+        return failed
+
+    # Catch up with the changes sent to the previous index while rebuilding.
+    # Their stored hashes refer to the previous index too
+    failed += rebuild_organization_index(workers, since=started, force=True)
+    failed += rebuild_dataset_index(workers, since=started, force=True)
+
+    return failed
+
+
+def get_rebuild_watermark() -> Optional[datetime.datetime]:
+    """
+    Return the start time (UTC) of the last successful full rebuild, if any
+    """
+    value = get_system_info(REBUILD_WATERMARK_KEY)
+
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def set_rebuild_watermark(value: datetime.datetime) -> None:
 
-    for id_ in org_ids:
-        index_organization(id_)
+    set_system_info(REBUILD_WATERMARK_KEY, value.isoformat())
 
 
 def clear_index():
-    for plugin in PluginImplementations(ISearchProvider):
-        if plugin.id in _get_indexing_providers():
-            plugin.clear_index()
+    for plugin in _get_indexing_plugins():
+        plugin.clear_index()
+        hashes.clear(plugin.id)
@@ -1,5 +1,5 @@
 # This will eventually live in CKAN core
-from typing import Any, Iterable, Optional, TypedDict
+from typing import Any, Iterable, Iterator, Optional, TypedDict
 
 from ckan.types import Schema
 from ckan.plugins.interfaces import Interface
@@ -20,6 +20,12 @@ class SearchResults(TypedDict, total=False):
     count: int
     results: list[dict[str, Any]]
     facets: dict[str, Any]
+    next_cursor: Optional[str]  # only when paging with a cursor, None on the last page
+
+
+class SearchProviderError(Exception):
+    """Raised by search providers when the search backend can not be reached
+    or returns an error"""
 
 
 class ISearchProvider(Interface):
@@ -48,6 +54,10 @@ class ISearchProvider(Interface):
         # TODO: config
         limit: int = 20,  # maximum records to return, None: maximum provider allows
         start: int = 0,
+        # "*" to start paging with a cursor, or the next_cursor of the previous page
+        cursor: Optional[str] = None,
+        # only return these keys of each record, e.g. ['title', 'name']
+        fields: Optional[list[str]] = None,
     ) -> Optional[SearchResults]:
         """generate search results or return None if another provider
         should be used for the query"""
@@ -59,6 +69,32 @@ class ISearchProvider(Interface):
         """create or update indexes for fields based on combined search
         schema containing all field names, types and repeating state"""
 
+    def begin_schema_update(self) -> None:
+        """called before initializing the provider and the search features.
+        Providers can use it to queue the schema changes made by all of them
+        until end_schema_update is called"""
+
+    def end_schema_update(self, success: bool) -> None:
+        """called once the provider and the search features have been
+        initialized. If success is True the queued schema changes should be
+        applied, raising SearchProviderError if that fails, otherwise they
+        should be discarded"""
+
+    def provider_schema(self, search_schema: SearchSchema) -> dict[str, Any]:
+        """return the translation of the combined search schema to the
+        provider specific format (e.g. field definitions or mappings). It is
+        used to detect changes in the schema"""
+        return {}
+
+    def get_schema_metadata(self) -> Optional[dict[str, Any]]:
+        """return the metadata stored in the index by the last call to
+        set_schema_metadata, or None if there is none"""
+        return None
+
+    def set_schema_metadata(self, metadata: dict[str, Any]) -> None:
+        """store metadata about the schema (like its fingerprint) in the
+        index, after it has been initialized"""
+
     def index_search_record(
         self,
         entity_type: str,
@@ -68,9 +104,57 @@ class ISearchProvider(Interface):
     ) -> None:
         "create or update search data record in index"
 
+    def index_search_records(
+        self,
+        entity_type: str,
+        records: dict[str, dict[str, str | list[str]]],
+        search_schema: SearchSchema,
+    ) -> None:
+        """create or update a batch of search data records in index. records
+        is a dict of record ids to search data. Providers should override
+        this to send the records in as few requests as possible"""
+        for id_, search_data in records.items():
+            self.index_search_record(entity_type, id_, search_data, search_schema)
+
+    def begin_bulk_indexing(self) -> None:
+        """called before indexing a large number of records, e.g. when
+        rebuilding the index. Providers can use it to defer commits or to
+        change the index settings until end_bulk_indexing is called"""
+
+    def end_bulk_indexing(self) -> None:
+        """called once the bulk indexing operation has finished, to commit
+        the changes and restore the index settings"""
+
+    def begin_shadow_rebuild(self) -> None:
+        """called before rebuilding all records. Providers that support it
+        should write records to a new index from now on, while searches
+        keep using the current one"""
+
+    def end_shadow_rebuild(self, success: bool) -> None:
+        """called once the shadow rebuild has finished. If success is True
+        the new index should atomically replace the current one, otherwise
+        it should be discarded"""
+
     def delete_search_record(self, entity_type: str, id_: str) -> None:
         "remove record from index"
 
+    def delete_search_records(self, entity_type: str, ids: list[str]) -> None:
+        """remove a batch of records from index. Providers should override
+        this to send the deletes in as few requests as possible"""
+        for id_ in ids:
+            self.delete_search_record(entity_type, id_)
+
+    def indexed_records(
+        self, entity_type: str
+    ) -> Optional[Iterator[tuple[str, Optional[str]]]]:
+        """generator of (id, metadata_modified) tuples for all records of the
+        entity type in the index, sorted by id in binary order.
+        metadata_modified is None if the record does not have one.
+        This method is used to identify missing, outdated and orphan records
+        in the search index, so it should stream the ids rather than load
+        them all in memory. Return None if the provider doesn't support it"""
+        return None
+
     # TODO: clear just one entity type
     def clear_index(self) -> None:
         """Clear all documents from the index"""
@@ -125,10 +209,12 @@ class ISearchFeature(Interface):
 
     def existing_record_ids(self, entity_type: str) -> Iterable[str]:
         """return a list or iterable of all record ids for the given entity type
-        managed by this feature. Return an empty list for core entity
-        types like 'package' or entity types managed by another feature.
+        managed by this feature, sorted in binary order. Return an empty list
+        for core entity types like 'package' or entity types managed by
+        another feature.
         This method is used to identify missing and orphan records in the
-        search index"""
+        search index, so it should stream the ids rather than load them all
+        in memory"""
 
     def fetch_records(
         self, entity_type: str, records: Optional[Iterable[str]]
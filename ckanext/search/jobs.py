@@ -0,0 +1,304 @@
+"""
+Keeps the search index up to date when entities are created, updated or
+deleted.
+
+Depending on the ckan.search.indexing_mode config option, changes are sent
+to the search providers right away (`sync`, the default) or added to a queue
+stored in Redis (`queue`). Queued changes for the same record are coalesced,
+and a background job sends them in batches once the
+ckan.search.queue.window period (in seconds) has passed since the first one.
+
+Operations that fail because the search backend is unavailable are stored in
+the local spool (see `ckanext.search.spool`) and replayed later, so an outage
+doesn't require a full rebuild afterwards. In sync mode each web host spools
+to its own storage path, so it needs its own `ckan search replay`.
+"""
+import logging
+import time
+from collections import defaultdict
+from collections.abc import Callable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction
+
+from ckan import model
+from ckan.lib.redis import connect_to_redis
+from ckan.plugins.toolkit import asint, config, enqueue_job
+
+from ckanext.search import index, spool
+from ckanext.search.interfaces import SearchProviderError
+
+
+log = logging.getLogger(__name__)
+
+INDEX = "index"
+DELETE = "delete"
+
+
+def _get_key(name: str) -> str:
+
+    return f"ckan:{config['ckan.site_id']}:search:{name}"
+
+
+def _get_window() -> int:
+
+    return asint(config.get("ckan.search.queue.window", 5))
+
+
+def _decode(value: bytes | str) -> str:
+
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def notify(entity_type: str, id_: str, operation: str) -> None:
+    """
+    Index (`operation="index"`) or remove (`operation="delete"`) a record,
+    either right away or via the queue depending on the indexing mode.
+
+    Nothing is sent until the current DB transaction is committed, so
+    changes that are rolled back don't reach the index and the flush job
+    always sees the committed data.
+    """
+    if not list(index._get_indexing_plugins()):
+        return
+
+    mode = _get_indexing_mode()
+    if mode not in ("sync", "queue"):
+        raise ValueError(f"Unknown indexing mode: {mode}")
+
+    pending = model.Session.info.setdefault(_PENDING, {})
+    pending[(entity_type, id_)] = operation
+
+
+def _get_indexing_mode() -> str:
+
+    return config.get("ckan.search.indexing_mode", "sync")
+
+
+def _send(operations: dict[tuple[str, str], str]) -> None:
+
+    if _get_indexing_mode() == "queue":
+        for (entity_type, id_), operation in operations.items():
+            enqueue(entity_type, id_, operation)
+        return
+
+    try:
+        process_operations(operations)
+    except Exception:
+        log.error(
+            f"Could not update {len(operations)} records in the search index",
+            exc_info=True,
+        )
+
+
+# Session.info keys with the operations of the current transaction, and the
+# ones of a transaction that was just committed
+_PENDING = "ckan.search.pending"
+_COMMITTED = "ckan.search.committed"
+
+
+@event.listens_for(model.Session, "after_commit")
+def _after_commit(session: Session) -> None:
+
+    # Savepoints can still be rolled back with the outer transaction
+    if session.in_nested_transaction():
+        return
+
+    if pending := session.info.pop(_PENDING, None):
+        session.info.setdefault(_COMMITTED, {}).update(pending)
+
+
+@event.listens_for(model.Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+
+    # Operations of a rolled back savepoint are kept, they are checked
+    # against the DB when sent anyway
+    if session.in_nested_transaction():
+        return
+
+    session.info.pop(_PENDING, None)
+
+
+@event.listens_for(model.Session, "after_transaction_end")
+def _after_transaction_end(session: Session, transaction: SessionTransaction) -> None:
+
+    # The data can't be read during after_commit, only once the transaction
+    # has ended
+    if transaction.parent is not None:
+        return
+
+    if committed := session.info.pop(_COMMITTED, None):
+        _send(committed)
+
+
+def enqueue(entity_type: str, id_: str, operation: str) -> None:
+    """
+    Add an operation to the queue and make sure that a job to flush it is
+    scheduled. Only the last operation for each record is kept.
+    """
+    redis = connect_to_redis()
+
+    redis.hset(_get_key("pending"), f"{entity_type}:{id_}", operation)
+
+    # Only one flush job is scheduled at a time. The key expires in case the
+    # job is lost for some reason
+    scheduled = redis.set(
+        _get_key("scheduled"), time.time(), nx=True, ex=_get_window() + 300
+    )
+    if scheduled:
+        enqueue_job(
+            flush_queue,
+            title="Update search index",
+            queue=config.get("ckan.search.queue.name", "default"),
+        )
+
+
+def flush_queue() -> None:
+    """
+    Background job that sends all the queued operations to the search
+    providers, once the coalescing window has passed.
+    """
+    redis = connect_to_redis()
+
+    scheduled = redis.get(_get_key("scheduled"))
+    if scheduled:
+        remaining = float(_decode(scheduled)) + _get_window() - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    # Clear the flag before taking the pending operations, so new ones
+    # schedule another flush
+    redis.delete(_get_key("scheduled"))
+
+    pipeline = redis.pipeline()
+    pipeline.hgetall(_get_key("pending"))
+    pipeline.delete(_get_key("pending"))
+    pending, _ = pipeline.execute()
+
+    operations = {}
+    for key, operation in pending.items():
+        entity_type, id_ = _decode(key).split(":", 1)
+        operations[(entity_type, id_)] = _decode(operation)
+
+    process_operations(operations)
+
+    # The providers are up again, send anything left from a previous outage
+    if spool.count():
+        replay_spool()
+
+
+def process_operations(
+    operations: dict[tuple[str, str], str], spool_failures: bool = True
+) -> None:
+    """
+    Send a set of operations, keyed by (entity_type, id), to the search
+    providers in batches.
+
+    If a batch fails with a SearchProviderError its operations are added to
+    the spool, unless `spool_failures` is False, in which case the exception
+    is raised. If it fails with any other error its records are sent one by
+    one, and the ones that still fail are logged and skipped.
+    """
+    to_index = defaultdict(list)
+    to_delete = defaultdict(list)
+    for (entity_type, id_), operation in operations.items():
+        if operation == DELETE:
+            to_delete[entity_type].append(id_)
+        else:
+            to_index[entity_type].append(id_)
+
+    size = index._get_indexing_batch_size()
+
+    batches = []
+    for entity_type, ids in to_delete.items():
+        for i in range(0, len(ids), size):
+            batches.append(
+                (index.delete_entities, entity_type, ids[i : i + size], DELETE)
+            )
+    for entity_type, ids in to_index.items():
+        for i in range(0, len(ids), size):
+            batches.append(
+                (index.index_entities, entity_type, ids[i : i + size], INDEX)
+            )
+
+    for func, entity_type, ids, operation in batches:
+        try:
+            _send_batch(func, entity_type, ids, operation, spool_failures)
+        except SearchProviderError:
+            raise
+        except Exception:
+            # Other errors are specific to some records (e.g. one that fails
+            # validation), find them so the rest are still sent
+            log.warning(
+                f"Error updating {len(ids)} {entity_type} records in the search "
+                "index, retrying them individually",
+                exc_info=True,
+            )
+            for id_ in ids:
+                try:
+                    _send_batch(func, entity_type, [id_], operation, spool_failures)
+                except SearchProviderError:
+                    raise
+                except Exception:
+                    log.error(
+                        f"Could not update {entity_type} {id_} in the search "
+                        "index, run `ckan search check` once fixed",
+                        exc_info=True,
+                    )
+
+    if operations:
+        log.debug(f"Updated {len(operations)} records in the search index")
+
+
+def _send_batch(
+    func: Callable[[str, list[str]], None],
+    entity_type: str,
+    ids: list[str],
+    operation: str,
+    spool_failures: bool,
+) -> None:
+
+    try:
+        func(entity_type, ids)
+    except SearchProviderError as e:
+        if not spool_failures:
+            raise
+        log.warning(
+            f"Could not update {len(ids)} {entity_type} records in the "
+            f"search index, adding them to the spool of this host (send them "
+            f"with `ckan search replay`): {e}"
+        )
+        spool.add({(entity_type, id_): operation for id_ in ids})
+        return
+
+    if spool_failures:
+        # Older operations for these records left from an outage are
+        # outdated now, don't replay them
+        spool.discard(entity_type, ids)
+
+
+def replay_spool() -> int:
+    """
+    Send the spooled operations to the search providers in batches, until
+    the spool is empty or the providers fail again. Returns the number of
+    operations sent.
+    """
+    size = index._get_indexing_batch_size()
+    replayed = 0
+    while rows := spool.take(size):
+        try:
+            operations = {
+                (entity_type, id_): operation
+                for _, entity_type, id_, operation in rows
+            }
+            process_operations(operations, spool_failures=False)
+        except SearchProviderError as e:
+            log.warning(f"Search providers still unavailable, stopping replay: {e}")
+            break
+        spool.remove([row[0] for row in rows])
+        replayed += len(rows)
+
+    if replayed:
+        log.info(f"Replayed {replayed} spooled operations")
+
+    return replayed
@@ -1,16 +1,21 @@
 # This will eventually live in ckan/logic/action/get.py
+import functools
+import json
+from collections.abc import Iterator
+from typing import Any
 
 import ckan.authz as authz
 from ckan.lib.plugins import get_permission_labels
 from ckan.plugins import PluginImplementations
 from ckan.plugins.toolkit import (
+    asint,
     check_access,
     config,
     side_effect_free,
     navl_validate,
     ValidationError,
 )
-from ckan.types import Context, DataDict
+from ckan.types import Context, DataDict, Schema
 from ckanext.search.interfaces import ISearchProvider, ISearchFeature
 from ckanext.search.schema import get_search_schema
 from ckanext.search.logic.schema import default_search_query_schema
@@ -30,11 +35,13 @@ def _get_permission_labels(context: Context) -> list[str] | None:
     return labels
 
 
-@side_effect_free
-def search(context: Context, data_dict: DataDict):
-
-    check_access("search", context, data_dict)
-
+@functools.cache
+def _get_query_schemas() -> tuple[Schema, Schema]:
+    """
+    Return the schemas used to validate the default and the additional query
+    params. They are the same for every query, so they are cached until the
+    plugins are reloaded (see `clear_caches()`)
+    """
     schema = default_search_query_schema()
 
     additional_params_schema = {}
@@ -46,6 +53,67 @@ def search(context: Context, data_dict: DataDict):
     for plugin in PluginImplementations(ISearchFeature):
         additional_params_schema.update(plugin.search_query_schema())
 
+    return schema, additional_params_schema
+
+
+def clear_caches() -> None:
+
+    _get_query_schemas.cache_clear()
+
+
+@side_effect_free
+def search(context: Context, data_dict: DataDict):
+
+    check_access("search", context, data_dict)
+
+    query_dict = _validate_query(context, data_dict)
+
+    return _run_query(query_dict)
+
+
+def export_records(context: Context, data_dict: DataDict) -> Iterator[str]:
+    """
+    Return a generator of all the records matching the query, serialized as
+    NDJSON lines. It accepts the same params as `search` except the paging
+    ones (`limit`, `start` and `cursor`).
+
+    This is not an action, as generators can't be returned by the action
+    API. It is used by the /api/search/export view and `ckan search export`.
+
+    Records are fetched in pages of ckan.search.export.batch_size records
+    using a cursor, so memory use and the cost of each page don't depend on
+    the number of results.
+    """
+    check_access("search_export", context, data_dict)
+
+    paging_params = [p for p in ("limit", "start", "cursor") if p in data_dict]
+    if paging_params:
+        raise ValidationError(
+            {p: ["Not supported when exporting"] for p in paging_params}
+        )
+
+    query_dict = _validate_query(context, data_dict)
+    query_dict["limit"] = asint(config.get("ckan.search.export.batch_size", 1000))
+    query_dict["cursor"] = "*"
+
+    # Validation happens before returning so errors are raised right away
+    def records() -> Iterator[str]:
+        while query_dict["cursor"]:
+            result = _run_query(query_dict) or {}
+            for record in result.get("results", []):
+                yield json.dumps(record) + "\n"
+            query_dict["cursor"] = result.get("next_cursor")
+
+    return records()
+
+
+def _validate_query(context: Context, data_dict: DataDict) -> dict[str, Any]:
+    """
+    Validate the query params and return the ones that will be sent to the
+    search provider, after the search features have modified them
+    """
+    schema, additional_params_schema = _get_query_schemas()
+
     # Any fields not in the default schema are moved to additional_params
     default_query_fields = schema.keys()
 
@@ -73,6 +141,9 @@ def search(context: Context, data_dict: DataDict):
         unknown_params = ", ".join(additional_params["__extras"].keys())
         raise ValidationError({"message": f"Unknown parameters: {unknown_params}"})
 
+    if query_dict.get("cursor") and query_dict.get("start"):
+        raise ValidationError({"cursor": ["Can not be used with start"]})
+
     query_dict["additional_params"] = additional_params
 
     # Make sure all default query params are present
@@ -101,6 +172,14 @@ def search(context: Context, data_dict: DataDict):
         else:
             query_dict["filters"] = perm_labels_filter_op
 
+    return query_dict
+
+
+def _run_query(query_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    Send the query to the search provider and return the results, after the
+    search features have modified them
+    """
     search_schema = get_search_schema()
     query_dict["search_schema"] = search_schema
     search_provider = config["ckan.search.search_provider"]
@@ -6,3 +6,10 @@ def search(context: Context, data_dict: DataDict) -> AuthResult:
     All users can search by default.
     """
     return {"success": True}
+
+
+def search_export(context: Context, data_dict: DataDict) -> AuthResult:
+    """
+    All users can export search results by default.
+    """
+    return {"success": True}
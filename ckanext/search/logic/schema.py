@@ -12,9 +12,9 @@ from ckan.types import (
     Context,
 )
 
-from ckan.plugins.toolkit import ValidationError
+from ckan.plugins.toolkit import Invalid, ValidationError
 from ckanext.search.filters import parse_query_filters
-from ckanext.search.schema import get_search_schema
+from ckanext.search.schema import INTERNAL_FIELDS, get_search_schema
 
 
 def query_filters_validator(search_schema) -> Validator:
@@ -36,6 +36,26 @@ def query_filters_validator(search_schema) -> Validator:
     return callable
 
 
+def result_fields_validator(value: Any) -> list[str]:
+    """
+    Accept a list or a comma separated string of field names to include in
+    the search results
+    """
+    if isinstance(value, str):
+        value = value.split(",")
+
+    if not isinstance(value, list) or not all(isinstance(f, str) for f in value):
+        raise Invalid("Must be a list or a comma separated string of field names")
+
+    fields = [f.strip() for f in value if f.strip()]
+
+    for field in fields:
+        if field in INTERNAL_FIELDS:
+            raise Invalid(f"Field can not be returned: {field}")
+
+    return fields
+
+
 @validator_args
 def default_search_query_schema(
     ignore_missing: Validator,
@@ -49,6 +69,7 @@ def default_search_query_schema(
     convert_to_list_if_string: Validator,
     limit_to_configured_maximum: ValidatorFactory,
     default: ValidatorFactory,
+    boolean_validator: Validator,
 ) -> Schema:
 
     return {
@@ -61,10 +82,13 @@ def default_search_query_schema(
         "sort": [ignore_missing, json_list_or_string],
         # TODO: index value based ordering
         "start": [default(0), natural_number_validator],
+        "cursor": [ignore_missing, unicode_safe],
         "filters": [
             ignore_missing,
             convert_to_json_if_string,
             query_filters_validator(get_search_schema()),
         ],
         "lang": [ignore_missing],
+        "return_ids": [default(False), boolean_validator],
+        "fields": [ignore_missing, json_list_or_string, result_fields_validator],
     }
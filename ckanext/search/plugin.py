@@ -1,29 +1,62 @@
 import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
+from ckan import model
 
-from ckanext.search import cli
+from ckanext.search import cli, index, jobs, views
 from ckanext.search.logic import actions, auth
 
 # TODO: All this whole plugin will eventually live in CKAN core
 
 class SearchPlugin(plugins.SingletonPlugin):
+    plugins.implements(plugins.IConfigurer)
     plugins.implements(plugins.IClick)
     plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IBlueprint)
     plugins.implements(plugins.IAuthFunctions)
+    plugins.implements(plugins.IPackageController, inherit=True)
+    plugins.implements(plugins.IOrganizationController, inherit=True)
+
+    # IConfigurer
+
+    def update_config(self, config):
+        # Called every time the plugins are loaded, so other search plugins
+        # may have been added or removed
+        index.clear_caches()
+        actions.clear_caches()
 
     # IActions
     def get_actions(self):
         return {
-            "search": actions.search
+            "search": actions.search,
         }
 
     # IAuthFunctions
     def get_auth_functions(self):
         return {
-            "search": auth.search
+            "search": auth.search,
+            "search_export": auth.search_export,
         }
 
+    # IBlueprint
+
+    def get_blueprint(self):
+        return views.get_blueprints()
+
     # IClick
 
     def get_commands(self):
         return cli.get_commands()
+
+    # IPackageController, IOrganizationController
+
+    def create(self, entity):
+        jobs.notify(self._get_entity_type(entity), entity.id, jobs.INDEX)
+
+    def edit(self, entity):
+        jobs.notify(self._get_entity_type(entity), entity.id, jobs.INDEX)
+
+    def delete(self, entity):
+        jobs.notify(self._get_entity_type(entity), entity.id, jobs.DELETE)
+
+    def _get_entity_type(self, entity):
+        return "dataset" if isinstance(entity, model.Package) else "organization"
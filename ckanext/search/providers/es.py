@@ -1,14 +1,24 @@
+import base64
+import datetime
 import hashlib
 import json
 import logging
-from typing import Any, Optional
+import os
+import re
+from typing import Any, Iterator, Optional
 
 from ckan.plugins import SingletonPlugin, implements
-from ckan.plugins.toolkit import config
-from elasticsearch import Elasticsearch
-
-from ckanext.search.interfaces import ISearchProvider, SearchResults, SearchSchema
+from ckan.plugins.toolkit import ValidationError, asint, config
+from elasticsearch import ApiError, Elasticsearch, TransportError, helpers
+
+from ckanext.search.interfaces import (
+    ISearchProvider,
+    SearchProviderError,
+    SearchResults,
+    SearchSchema,
+)
 from ckanext.search.filters import FilterOp
+from ckanext.search.sort import SCORE, parse_sort
 
 log = logging.getLogger(__name__)
 
@@ -20,9 +30,19 @@ class ElasticSearchProvider(SingletonPlugin):
     id = "elasticsearch"
 
     _client = None
+    _client_pid = None
 
+    # Name of the index, or of the alias pointing to the current generation
+    # of the index
     _index_name = ""
 
+    _bulk_indexing = False
+    _bulk_original_settings: dict[str, Any] = {}
+
+    # New generation of the index written to during a shadow rebuild
+    _shadow_index = ""
+    _shadow_replicas: Optional[str] = None
+
     def __init__(self, *args: Any, **kwargs: Any):
 
         super().__init__(*args, **kwargs)
@@ -41,14 +61,30 @@ class ElasticSearchProvider(SingletonPlugin):
         # This will raise an exception if there are connection issues
         log.debug(client.info())
 
-        # Check if index exists, create otherwise
+        # Check if index exists, create otherwise. The index is versioned and
+        # accessed via an alias, so shadow rebuilds can replace it
         if not client.indices.exists(index=self._index_name):
 
+            index_name = self._get_new_index_name()
+
             # TODO: what else do we need?
-            params = {"index": self._index_name, "mappings": {"dynamic": "false"}}
+            params = {
+                "index": index_name,
+                "mappings": {"dynamic": "false"},
+                "aliases": {self._index_name: {}},
+            }
 
             client.indices.create(**params)
-            log.info("Created new index '%s'" % self._index_name)
+            log.info(f"Created new index '{index_name}' (alias '{self._index_name}')")
+
+        mapping = self.provider_schema(search_schema)
+        for field_name, field in mapping["properties"].items():
+            log.info(f"Added field '{field_name}' to index, with params {field}")
+
+        client.indices.put_mapping(index=self._index_name, body=mapping)
+        log.info("Updated index with mapping")
+
+    def provider_schema(self, search_schema: SearchSchema) -> dict[str, Any]:
 
         # Translate common search schema format to ES format
         es_field_types = {
@@ -59,7 +95,7 @@ class ElasticSearchProvider(SingletonPlugin):
         mapping = {"properties": {}}
         for field_name, field in search_schema.get("fields", {}).items():
 
-            field_type = field.pop("type")
+            field_type = field["type"]
 
             if field_type in es_field_types:
                 field_type = es_field_types[field_type]
@@ -70,12 +106,28 @@ class ElasticSearchProvider(SingletonPlugin):
                 "index": field.get("indexed", True),
                 "store": field.get("stored", False),
             }
-            log.info(
-                f"Added field '{field_name}' to index, with type {field_type} and params {field}"
-            )
 
-        client.indices.put_mapping(index=self._index_name, body=mapping)
-        log.info("Updated index with mapping")
+        return mapping
+
+    def get_schema_metadata(self) -> Optional[dict[str, Any]]:
+
+        client = self.get_client()
+
+        if not client.indices.exists(index=self._index_name):
+            return None
+
+        response = client.indices.get_mapping(index=self._index_name)
+        mappings = next(iter(response.values()))["mappings"]
+
+        return mappings.get("_meta", {}).get("ckan_search")
+
+    def set_schema_metadata(self, metadata: dict[str, Any]) -> None:
+
+        client = self.get_client()
+
+        client.indices.put_mapping(
+            index=self._index_name, meta={"ckan_search": metadata}
+        )
 
     def index_search_record(
         self,
@@ -84,18 +136,206 @@ class ElasticSearchProvider(SingletonPlugin):
         search_data: dict[str, str | list[str]],
         search_schema: SearchSchema,
     ) -> None:
+
+        self.index_search_records(entity_type, {id_: search_data}, search_schema)
+
+    def index_search_records(
+        self,
+        entity_type: str,
+        records: dict[str, dict[str, str | list[str]]],
+        search_schema: SearchSchema,
+    ) -> None:
         # TODO: provider specific params
 
+        actions = []
+        for id_, search_data in records.items():
+
+            index_id = id_
+
+            # TODO: choose what to commit
+            search_data.pop("organization", None)
+
+            actions.append(
+                {
+                    "_index": self._get_write_index(),
+                    "_id": index_id,
+                    "_source": search_data,
+                }
+            )
+
+        self._bulk(actions)
+
+    def delete_search_record(self, entity_type: str, id_: str) -> None:
+
+        self.delete_search_records(entity_type, [id_])
+
+    def delete_search_records(self, entity_type: str, ids: list[str]) -> None:
+
+        actions = [
+            {"_op_type": "delete", "_index": self._get_write_index(), "_id": id_}
+            for id_ in ids
+        ]
+
+        # Records that are not in the index are not an error
+        self._bulk(actions, ignore_status=(404,))
+
+    def _bulk(self, actions: list[dict[str, Any]], **kwargs: Any) -> None:
+
+        client = self.get_client()
+
+        batch_size = asint(config.get("ckan.search.elasticsearch.batch_size", 500))
+
+        # Sent to the _bulk endpoint in chunks of batch_size
+        try:
+            helpers.bulk(
+                client,
+                actions,
+                chunk_size=batch_size,
+                refresh=self._get_refresh(),
+                **kwargs,
+            )
+        except helpers.BulkIndexError as e:
+            raise SearchProviderError(
+                f"Elasticsearch returned errors: {str(e.errors)[:1000]}"
+            )
+        except (ApiError, TransportError) as e:
+            msg = f"Error sending records to Elasticsearch: {str(e)[:1000]}"
+            log.error(msg)
+            raise SearchProviderError(msg)
+
+    def begin_bulk_indexing(self) -> None:
+
+        client = self.get_client()
+
+        # Disable refreshes and replicas while indexing, keeping the current
+        # values so they can be restored at the end. Settings not explicitly
+        # set are restored to their defaults
+        index_name = self._get_write_index()
+        response = client.indices.get_settings(index=index_name, flat_settings=True)
+        settings = next(iter(response.values()))["settings"]
+        self._bulk_original_settings = {
+            "index.refresh_interval": settings.get("index.refresh_interval"),
+            "index.number_of_replicas": settings.get("index.number_of_replicas"),
+        }
+
+        client.indices.put_settings(
+            index=index_name,
+            settings={"index.refresh_interval": "-1", "index.number_of_replicas": 0},
+        )
+        log.info(f"Disabled refresh and replicas on index '{index_name}'")
+
+        self._bulk_indexing = True
+
+    def end_bulk_indexing(self) -> None:
+
+        self._bulk_indexing = False
+
+        client = self.get_client()
+
+        index_name = self._get_write_index()
+        client.indices.put_settings(
+            index=index_name, settings=self._bulk_original_settings
+        )
+        client.indices.refresh(index=index_name)
+        log.info(
+            f"Restored settings {self._bulk_original_settings} "
+            f"and refreshed index '{index_name}'"
+        )
+
+    def begin_shadow_rebuild(self) -> None:
+
+        client = self.get_client()
+
+        # Create a new generation of the index with the same mappings as the
+        # current one, optimized for indexing. Searches keep using the current
+        # one until the rebuild ends
+        current = client.indices.get(index=self._index_name)
+        current_index = next(iter(current.values()))
+
+        self._shadow_replicas = current_index["settings"]["index"].get(
+            "number_of_replicas"
+        )
+
+        index_name = self._get_new_index_name()
+        client.indices.create(
+            index=index_name,
+            mappings=current_index["mappings"],
+            settings={"index.refresh_interval": "-1", "index.number_of_replicas": 0},
+        )
+        log.info(f"Created new index '{index_name}' for shadow rebuild")
+
+        self._shadow_index = index_name
+
+    def end_shadow_rebuild(self, success: bool) -> None:
+
+        index_name = self._shadow_index
+        self._shadow_index = ""
+        if not index_name:
+            return
+
+        client = self.get_client()
+
+        if not success:
+            client.indices.delete(index=index_name)
+            log.warning(f"Shadow rebuild failed, deleted index '{index_name}'")
+            return
+
+        client.indices.put_settings(
+            index=index_name,
+            settings={
+                "index.refresh_interval": None,
+                "index.number_of_replicas": self._shadow_replicas,
+            },
+        )
+        client.indices.refresh(index=index_name)
+
+        # Point the alias to the new index in a single atomic operation
+        actions: list[dict[str, Any]] = [
+            {"add": {"index": index_name, "alias": self._index_name}}
+        ]
+        if client.indices.exists_alias(name=self._index_name):
+            previous = list(client.indices.get_alias(name=self._index_name).keys())
+            actions.insert(
+                0, {"remove": {"indices": previous, "alias": self._index_name}}
+            )
+        elif client.indices.exists(index=self._index_name):
+            # Index created before versioned indexes were used, it needs to be
+            # removed to create an alias with the same name
+            actions.insert(0, {"remove_index": {"index": self._index_name}})
+        client.indices.update_aliases(actions=actions)
+        log.info(f"Alias '{self._index_name}' now points to index '{index_name}'")
+
+        self._delete_old_generations(index_name)
+
+    def _get_write_index(self) -> str:
+
+        return self._shadow_index or self._index_name
+
+    def _get_new_index_name(self) -> str:
+
+        timestamp = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
+
+        return f"{self._index_name}-{timestamp}"
+
+    def _delete_old_generations(self, current_index: str) -> None:
+        """
+        Delete previous generations of the index, keeping the number set in
+        ckan.search.elasticsearch.keep_generations (default 1) so it is
+        possible to roll back by pointing the alias to them
+        """
         client = self.get_client()
 
-        index_id = id_
+        keep = asint(config.get("ckan.search.elasticsearch.keep_generations", 1))
 
-        # TODO: choose what to commit
-        search_data.pop("organization", None)
-        # TODO: refresh
-        client.index(
-            index=self._index_name, id=index_id, document=search_data, refresh="true"
+        pattern = re.compile(rf"^{re.escape(self._index_name)}-\d{{14}}$")
+        previous = sorted(
+            name
+            for name in client.indices.get(index=f"{self._index_name}-*")
+            if pattern.match(name) and name < current_index
         )
+        for name in previous[: max(len(previous) - keep, 0)]:
+            client.indices.delete(index=name)
+            log.info(f"Deleted old index '{name}'")
 
     def search_query(
         self,
@@ -110,6 +350,8 @@ class ElasticSearchProvider(SingletonPlugin):
         return_facets: bool = False,
         limit: int = 20,
         start: int = 0,
+        cursor: Optional[str] = None,
+        fields: Optional[list[str]] = None,
     ) -> Optional[SearchResults]:
 
         es_params = {"size": limit, "from": start}
@@ -134,18 +376,98 @@ class ElasticSearchProvider(SingletonPlugin):
         else:
             es_params["query"] = {"match_all": {}}
 
+        if sort_dsl := self._sort_to_es_sort(parse_sort(sort, search_schema)):
+            es_params["sort"] = sort_dsl
+
+        if return_ids:
+            # Don't fetch and parse the stored data dicts, ids are in _id
+            es_params["source"] = False
+        elif fields:
+            # The source has the same values as the records, so the fields can
+            # be returned without parsing the whole records
+            es_params["source"] = {"includes": fields}
+
         client = self.get_client()
 
-        # TODO: error handling
-        es_response = client.search(index=self._index_name, **es_params)
+        if cursor:
+            # Deep paging with search_after on a point in time, which keeps a
+            # consistent view of the index between pages. "*" starts a new one
+            keep_alive = config.get("ckan.search.elasticsearch.cursor_keep_alive", "1m")
+            if cursor == "*":
+                pit = client.open_point_in_time(
+                    index=self._index_name, keep_alive=keep_alive
+                )
+                pit_id = pit["id"]
+            else:
+                pit_id, search_after = self._decode_cursor(cursor)
+                es_params["search_after"] = search_after
+
+            # Tie-break on the shard and document
+            es_params["sort"] = es_params.get("sort", [{"_score": "desc"}]) + [
+                {"_shard_doc": "asc"}
+            ]
+            es_params["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+            es_params.pop("from")
+
+            # TODO: error handling
+            es_response = client.search(**es_params)
+        else:
+            # TODO: error handling
+            es_response = client.search(index=self._index_name, **es_params)
+
+        hits = es_response["hits"]["hits"]
 
         items = []
-        for doc in es_response["hits"]["hits"]:
+        for doc in hits:
+            if return_ids:
+                items.append(doc["_id"])
+                continue
+
             doc = doc["_source"]
+            if fields:
+                items.append({field: doc[field] for field in fields if field in doc})
+                continue
+
             # TODO allow to choose validated/not validated? i.e use_default_schema
             items.append(json.loads(doc["validated_data_dict"]))
 
-        return {"count": es_response["hits"]["total"]["value"], "results": items, "facets": {}}
+        result = {
+            "count": es_response["hits"]["total"]["value"],
+            "results": items,
+            "facets": {},
+        }
+
+        if cursor:
+            pit_id = es_response.get("pit_id", pit_id)
+            if not hits or len(hits) < limit:
+                # Last page
+                client.close_point_in_time(id=pit_id)
+                result["next_cursor"] = None
+            else:
+                result["next_cursor"] = self._encode_cursor(pit_id, hits[-1]["sort"])
+
+        return result
+
+    def _sort_to_es_sort(self, sort_fields: list[tuple[str, str]]) -> list[dict]:
+
+        return [
+            {"_score" if field == SCORE else field: {"order": direction}}
+            for field, direction in sort_fields
+        ]
+
+    def _encode_cursor(self, pit_id: str, search_after: list[Any]) -> str:
+
+        data = json.dumps({"pit_id": pit_id, "search_after": search_after})
+
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def _decode_cursor(self, cursor: str) -> tuple[str, list[Any]]:
+
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return data["pit_id"], data["search_after"]
+        except (ValueError, TypeError, KeyError):
+            raise ValidationError({"cursor": ["Invalid cursor"]})
 
     def _filterop_to_es_query(
         self, filter_op: FilterOp, search_schema: SearchSchema
@@ -220,6 +542,50 @@ class ElasticSearchProvider(SingletonPlugin):
             return field_info.get("type")
         return None
 
+    def indexed_records(
+        self, entity_type: str
+    ) -> Iterator[tuple[str, Optional[str]]]:
+
+        client = self.get_client()
+
+        batch_size = asint(config.get("ckan.search.elasticsearch.batch_size", 500))
+
+        # A point in time keeps a consistent view of the index while paging
+        # through it with search_after
+        pit = client.open_point_in_time(index=self._index_name, keep_alive="5m")
+        pit_id = pit["id"]
+        try:
+            search_after = None
+            while True:
+                params: dict[str, Any] = {
+                    "pit": {"id": pit_id, "keep_alive": "5m"},
+                    "query": {"term": {"entity_type": entity_type}},
+                    "sort": [{"id": "asc"}],
+                    "source": ["metadata_modified"],
+                    "size": batch_size,
+                }
+                if search_after:
+                    params["search_after"] = search_after
+
+                try:
+                    resp = client.search(**params)
+                except (ApiError, TransportError) as e:
+                    raise SearchProviderError(
+                        f"Error querying Elasticsearch: {str(e)[:1000]}"
+                    )
+
+                hits = resp["hits"]["hits"]
+                if not hits:
+                    break
+
+                for hit in hits:
+                    yield hit["_id"], hit["_source"].get("metadata_modified")
+
+                search_after = hits[-1]["sort"]
+                pit_id = resp.get("pit_id", pit_id)
+        finally:
+            client.close_point_in_time(id=pit_id)
+
     def clear_index(self) -> None:
 
         client = self.get_client()
@@ -233,11 +599,28 @@ class ElasticSearchProvider(SingletonPlugin):
         )
         log.info("Cleared all documents in the search index")
 
+    def _get_refresh(self) -> str:
+        """
+        Return the refresh policy for write requests, based on the
+        ckan.search.elasticsearch.refresh config option: true (default),
+        false or wait_for. During bulk indexing the index is refreshed
+        only once at the end.
+        """
+        if self._bulk_indexing:
+            return "false"
+
+        refresh = config.get("ckan.search.elasticsearch.refresh", "true")
+        if refresh not in ("true", "false", "wait_for"):
+            raise ValueError(f"Unknown Elasticsearch refresh policy: {refresh}")
+
+        return refresh
+
     # Provider methods
 
     def get_client(self) -> Elasticsearch:
 
-        if self._client:
+        # The client connection pool can't be shared with forked processes
+        if self._client and self._client_pid == os.getpid():
             return self._client
 
         # TODO: config declaration
@@ -252,5 +635,6 @@ class ElasticSearchProvider(SingletonPlugin):
         self._client = Elasticsearch(
             config["ckan.search.elasticsearch.url"], **es_config
         )
+        self._client_pid = os.getpid()
 
         return self._client
@@ -1,20 +1,32 @@
+import contextlib
+import datetime
 import hashlib
 import json
 import logging
+import os
 import socket
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, Optional
 from urllib.parse import urlparse, urlunparse
 
 import pysolr
 import requests
 from ckan.plugins import SingletonPlugin, implements
-from ckan.plugins.toolkit import config, get_validator
+from ckan.plugins.toolkit import asint, config, get_validator
 from ckan.types import Schema
-from ckanext.search.interfaces import ISearchProvider, SearchResults, SearchSchema
+from ckanext.search.interfaces import (
+    ISearchProvider,
+    SearchProviderError,
+    SearchResults,
+    SearchSchema,
+)
 from ckanext.search.filters import FilterOp
+from ckanext.search.sort import is_sortable, parse_sort
 
 log = logging.getLogger(__name__)
 
+# User property of the core config storing the schema metadata
+SCHEMA_METADATA_PROPERTY = "ckan.search.schema"
+
 
 class SolrSchema:
 
@@ -23,6 +35,23 @@ class SolrSchema:
     schema_admin_url: str = ""
     cores_url: str = ""
 
+    # Schema of the core, fetched once and kept up to date with the changes
+    # sent (see get_schema())
+    _schema: Optional[Dict[str, Any]] = None
+    # Schema commands queued inside a batch() block, and how many blocks are
+    # open (only the outermost one sends them)
+    _pending: Optional[list[tuple[str, Dict[str, Any]]]] = None
+    _batch_depth: int = 0
+
+    # Order in which queued commands are sent, so dependencies are created
+    # first
+    _command_order = {
+        "add-field-type": "fieldTypes",
+        "add-field": "fields",
+        "add-dynamic-field": "dynamicFields",
+        "add-copy-field": "copyFields",
+    }
+
     def __init__(self, solr_url: str, core_name: str | None = None) -> None:
 
         # TODO: check URL, auth
@@ -33,6 +62,7 @@ class SolrSchema:
         solr_root_url = urlunparse(
             (parts.scheme, parts.netloc, "solr", None, None, None)
         )
+        self.solr_root_url = solr_root_url
 
         path_parts = [p for p in parts.path.split("/") if p]
         if not core_name:
@@ -57,17 +87,96 @@ class SolrSchema:
 
         self.schema_admin_url = f"{self.core_url}/schema"
         self.cores_admin_url = f"{solr_root_url}/admin/cores"
+        self.collections_admin_url = f"{solr_root_url}/admin/collections"
 
     def _request(self, command: str, params: Dict[str, Any]) -> Dict[str, Any]:
 
-        data = {command: params}
+        if self._pending is not None:
+            self._pending.append((command, params))
+            return {}
+
+        return self._send_commands([(command, params)])
+
+    def _send_commands(
+        self, commands: list[tuple[str, Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Send several schema commands in a single request. Solr applies them
+        all or none of them.
+        """
+        data = {}
+        for command in self._command_order:
+            params = [p for c, p in commands if c == command]
+            if params:
+                data[command] = params
+
         # TODO: auth
         resp = requests.post(
             self.schema_admin_url,
             json=data,
         )
+        resp = resp.json()
 
-        return resp.json()
+        if "error" not in resp and self._schema is not None:
+            for command, params in commands:
+                key = self._command_order[command]
+                self._schema.setdefault(key, []).append(params)
+
+        return resp
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Queue the schema changes made inside the block and send them in a
+        single request at the end. Raises SearchProviderError if Solr rejects
+        them (none of them are applied in that case)
+
+        Blocks can be nested, the changes are sent when the outermost one
+        ends.
+        """
+        self.begin_batch()
+        try:
+            yield
+        except Exception:
+            self.end_batch(send=False)
+            raise
+        self.end_batch()
+
+    def begin_batch(self) -> None:
+
+        if self._pending is None:
+            self._pending = []
+        self._batch_depth += 1
+
+    def end_batch(self, send: bool = True) -> None:
+
+        self._batch_depth -= 1
+        if self._batch_depth > 0:
+            return
+
+        commands, self._pending = self._pending, None
+
+        if not commands or not send:
+            return
+
+        resp = self._send_commands(commands)
+        if "error" in resp:
+            raise SearchProviderError(
+                f"Error updating the Solr schema: {self.get_error(resp)}"
+            )
+
+        log.info(f"Sent {len(commands)} changes to the Solr schema")
+
+    @staticmethod
+    def get_error(resp: Dict[str, Any]) -> str:
+
+        msg = ""
+        if "details" in resp["error"]:
+            msg = resp["error"]["details"][0]["errorMessages"]
+        elif "msg" in resp["error"]:
+            msg = resp["error"]["msg"][:1000]
+
+        return msg
 
     def get_core(self, core_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
@@ -99,18 +208,176 @@ class SolrSchema:
         # TODO: auth, error handling
         resp = requests.get(self.cores_admin_url, params=params).json()
 
+        if core_name == self.core_name:
+            self._schema = None
+
         return resp
 
-    def get_field(self, name: str) -> Optional[Dict[str, Any]]:
+    def unload_core(self, core_name: str) -> Dict[str, Any]:
+        """
+        Unload a core from Solr, deleting its data.
+        """
+        params = {"action": "UNLOAD", "core": core_name, "deleteInstanceDir": "true"}
+
+        return self._admin_request(self.cores_admin_url, params)
+
+    def swap_cores(self, core_name: str, other_core_name: str) -> Dict[str, Any]:
+        """
+        Atomically swap the names of two cores.
+        """
+        params = {"action": "SWAP", "core": core_name, "other": other_core_name}
+
+        self._schema = None
+
+        return self._admin_request(self.cores_admin_url, params)
+
+    def is_cloud(self) -> bool:
+
+        # TODO: auth
+        data = requests.get(f"{self.solr_root_url}/admin/info/system").json()
+
+        return data.get("mode") == "solrcloud"
+
+    def get_aliases(self) -> Dict[str, str]:
+        """
+        Get the collection aliases in SolrCloud, as alias name to
+        comma-separated collection names.
+        """
+        params = {"action": "LISTALIASES"}
 
-        url = f"{self.schema_admin_url}/fields/{name}"
+        return self._admin_request(self.collections_admin_url, params).get(
+            "aliases", {}
+        )
+
+    def get_collection(self, name: str) -> Dict[str, Any]:
+
+        params = {"action": "CLUSTERSTATUS", "collection": name}
+        data = self._admin_request(self.collections_admin_url, params)
+
+        return data["cluster"]["collections"][name]
+
+    def create_collection(self, name: str, **kwargs: Any) -> Dict[str, Any]:
+
+        params = {"action": "CREATE", "name": name}
+        params.update(kwargs)
+
+        return self._admin_request(self.collections_admin_url, params)
+
+    def delete_collection(self, name: str) -> Dict[str, Any]:
+
+        params = {"action": "DELETE", "name": name}
+
+        return self._admin_request(self.collections_admin_url, params)
+
+    def create_alias(self, name: str, collection: str) -> Dict[str, Any]:
+        """
+        Create or atomically update a collection alias.
+        """
+        params = {"action": "CREATEALIAS", "name": name, "collections": collection}
+
+        return self._admin_request(self.collections_admin_url, params)
+
+    def get_schema(
+        self, core_name: Optional[str] = None, refresh: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Get the full schema of a core (fields, field types, copy fields, etc).
+        The schema of this client's core is only requested once, unless
+        `refresh` is True.
+        """
+        if core_name and core_name != self.core_name:
+            # TODO: auth, error handling
+            url = f"{self.solr_root_url}/{core_name}/schema"
+            return requests.get(url).json()["schema"]
+
+        if self._schema is None or refresh:
+            # TODO: auth, error handling
+            self._schema = requests.get(self.schema_admin_url).json()["schema"]
+
+        return self._schema
+
+    def _find_in_schema(self, key: str, name: str) -> Optional[Dict[str, Any]]:
+
+        for item in self.get_schema().get(key, []):
+            if item["name"] == name:
+                return item
+
+        return None
+
+    def copy_schema(self, core_name: str) -> Dict[str, Any]:
+        """
+        Add the field types, fields, dynamic fields and copy fields of this
+        core's schema that are missing in the schema of another core, in a
+        single request.
+        """
+        source = self.get_schema(refresh=True)
+        target = self.get_schema(core_name)
+
+        def _missing(key: str) -> list[Dict[str, Any]]:
+            existing = {item["name"] for item in target.get(key, [])}
+            return [
+                item for item in source.get(key, []) if item["name"] not in existing
+            ]
+
+        existing_copy_fields = {
+            (item["source"], item["dest"]) for item in target.get("copyFields", [])
+        }
+        commands = {
+            "add-field-type": _missing("fieldTypes"),
+            "add-field": _missing("fields"),
+            "add-dynamic-field": _missing("dynamicFields"),
+            "add-copy-field": [
+                {"source": item["source"], "dest": item["dest"]}
+                for item in source.get("copyFields", [])
+                if (item["source"], item["dest"]) not in existing_copy_fields
+            ],
+        }
+        commands = {command: items for command, items in commands.items() if items}
+        if not commands:
+            return {}
 
         # TODO: auth, error handling
-        resp = requests.get(url)
+        resp = requests.post(f"{self.solr_root_url}/{core_name}/schema", json=commands)
 
-        resp = resp.json()
+        return resp.json()
+
+    def _admin_request(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+
+        # TODO: auth
+        data = requests.get(url, params=params).json()
+
+        if data.get("error") or data.get("responseHeader", {}).get("status"):
+            error = data.get("error", {}).get("msg") or str(data)[:1000]
+            raise SearchProviderError(
+                f"Solr admin request {params.get('action')} failed: {error}"
+            )
+
+        return data
+
+    def get_user_property(self, name: str) -> Optional[str]:
+        """
+        Get a user property from the config overlay of the core. Returns None
+        if the core or the property do not exist.
+        """
+        # TODO: auth
+        resp = requests.get(f"{self.core_url}/config/overlay")
+        if not resp.ok:
+            return None
 
-        return resp["field"] if resp.get("field") else None
+        return resp.json().get("overlay", {}).get("userProps", {}).get(name)
+
+    def set_user_property(self, name: str, value: str) -> Dict[str, Any]:
+
+        # TODO: auth, error handling
+        resp = requests.post(
+            f"{self.core_url}/config", json={"set-user-property": {name: value}}
+        )
+
+        return resp.json()
+
+    def get_field(self, name: str) -> Optional[Dict[str, Any]]:
+
+        return self._find_in_schema("fields", name)
 
     def add_field(self, name: str, type_: str, **kwargs: Any) -> Dict[str, Any]:
 
@@ -123,14 +390,7 @@ class SolrSchema:
 
     def get_field_type(self, name: str) -> Optional[Dict[str, Any]]:
 
-        url = f"{self.schema_admin_url}/fieldtypes/{name}"
-
-        # TODO: auth, error handling
-        resp = requests.get(url)
-
-        resp = resp.json()
-
-        return resp["fieldType"] if resp.get("fieldType") else None
+        return self._find_in_schema("fieldTypes", name)
 
     def add_field_type(self, name: str, **kwargs: Any) -> Dict[str, Any]:
 
@@ -143,19 +403,13 @@ class SolrSchema:
 
     def get_copy_field(self, source: str, dest: str) -> Optional[Dict[str, Any]]:
 
-        url = f"{self.schema_admin_url}/copyfields"
+        copy_fields = [
+            copy_field
+            for copy_field in self.get_schema().get("copyFields", [])
+            if copy_field["source"] == source and copy_field["dest"] == dest
+        ]
 
-        params = {
-            "source.fl": [source],
-            "dest.fl": [dest],
-        }
-
-        # TODO: auth, error handling
-        resp = requests.get(url, params=params)
-
-        resp = resp.json()
-
-        return resp["copyFields"] if resp.get("copyFields") else None
+        return copy_fields or None
 
     def copy_field(self, source: str, dest: str) -> Dict[str, Any]:
 
@@ -173,9 +427,19 @@ class SolrSearchProvider(SingletonPlugin):
     id = "solr"
 
     _client = None
+    _client_pid = None
     _admin_client = None
     _core_admin_client = None
 
+    _bulk_indexing = False
+
+    # Core (or collection in SolrCloud) written to during a shadow rebuild
+    _shadow_name = ""
+    _shadow_client = None
+    _shadow_client_pid = None
+    # Collections previously pointed to by the alias, in SolrCloud
+    _shadow_previous: list[str] = []
+
     # ISearchProvider
 
     def initialize_search_provider(
@@ -194,16 +458,64 @@ class SolrSearchProvider(SingletonPlugin):
         #   - Delete fields no longer in the schema
         #   - Delete copy fields no longer needed
 
-        # Create catch-all field
+        # Read the current schema once, and send all the changes needed in a
+        # single request at the end
+        admin_client.get_schema(refresh=True)
 
-        # TODO: lang
+        with admin_client.batch():
+            self._initialize_schema(admin_client, search_schema)
 
-        if not admin_client.get_field("text_combined"):
-            admin_client.add_field(
-                "text_combined", "text_en", indexed=True, stored=False, multiValued=True
-            )
+    def begin_schema_update(self) -> None:
+
+        self.get_admin_client().begin_batch()
+
+    def end_schema_update(self, success: bool) -> None:
+
+        self.get_admin_client().end_batch(send=success)
+
+    def _initialize_schema(
+        self, admin_client: SolrSchema, search_schema: SearchSchema
+    ) -> None:
 
-        # Set unique id
+        for field_name, field in self.provider_schema(search_schema).items():
+
+            field = dict(field)
+            field_type = field.pop("type")
+
+            if admin_client.get_field(field_name):
+                log.info(
+                    f"Field '{field_name}' exists and clear not provided, skipping"
+                )
+            else:
+                admin_client.add_field(field_name, field_type, **field)
+                log.info(
+                    f"Adding field '{field_name}' to index, with type {field_type} "
+                    f"and params {field}"
+                )
+
+            # Copy text values to catch-all field
+            if field_type.startswith("text") and field_name != "text_combined":
+                if not admin_client.get_copy_field(field_name, "text_combined"):
+                    admin_client.copy_field(field_name, "text_combined")
+                    log.info(f"Adding field '{field_name}' to combined text field")
+
+    def provider_schema(self, search_schema: SearchSchema) -> dict[str, Any]:
+        """
+        Translate the search schema into Solr field definitions
+        """
+        fields = {
+            # Create catch-all field
+            # TODO: lang
+            "text_combined": {
+                "type": "text_en",
+                "indexed": True,
+                "stored": False,
+                "multiValued": True,
+            },
+            # Set unique id
+            # Hashed id used to update and delete the records of this site
+            "index_id": {"type": "string", "indexed": True, "stored": True},
+        }
 
         # TODO: Create dynamic fields? eg. *_date, *_list, etc
 
@@ -217,38 +529,34 @@ class SolrSearchProvider(SingletonPlugin):
 
         for field_name, field in search_schema.get("fields", {}).items():
 
+            # Don't modify the search schema passed
+            field = dict(field)
+
+            # Translate common search schema format to Solr format
             field_type = field.pop("type")
-            if admin_client.get_field(field_name):
-                log.info(
-                    f"Field '{field_name}' exists and clear not provided, skipping"
-                )
-            else:
-                # Translate common search schema format to Solr format
+            field["type"] = solr_field_types.get(field_type, field_type)
+            field["multiValued"] = field.pop("multiple", False)
 
-                if field_type in solr_field_types:
-                    field_type = solr_field_types[field_type]
+            # Fields that can be used to sort get docValues, so sorting and
+            # paging are handled efficiently on the server
+            if is_sortable(search_schema["fields"][field_name]):
+                field["docValues"] = True
 
-                field["multiValued"] = field.pop("multiple", False)
+            fields[field_name] = field
 
-                resp = admin_client.add_field(field_name, field_type, **field)
-                if "error" in resp:
-                    msg = ""
-                    if "details" in resp["error"]:
-                        msg = resp["error"]["details"][0]["errorMessages"]
-                    elif "msg" in resp["error"]:
-                        msg = resp["error"]["msg"][:1000]
+        return fields
 
-                    log.warning(f'Error creating field "{field_name}": {msg}')
-                else:
-                    log.info(
-                        f"Added field '{field_name}' to index, with type {field_type} and params {field}"
-                    )
+    def get_schema_metadata(self) -> Optional[dict[str, Any]]:
 
-            # Copy text values to catch-all field
-            if field_type.startswith("text"):
-                if not admin_client.get_copy_field(field_name, "text_combined"):
-                    admin_client.copy_field(field_name, "text_combined")
-                    log.info(f"Added field '{field_name}' to combined text field")
+        value = self.get_admin_client().get_user_property(SCHEMA_METADATA_PROPERTY)
+
+        return json.loads(value) if value else None
+
+    def set_schema_metadata(self, metadata: dict[str, Any]) -> None:
+
+        self.get_admin_client().set_user_property(
+            SCHEMA_METADATA_PROPERTY, json.dumps(metadata)
+        )
 
     # TODO: do we need id_ or we just check the search_data dict?
     def index_search_record(
@@ -259,32 +567,161 @@ class SolrSearchProvider(SingletonPlugin):
         search_schema: SearchSchema,
     ) -> None:
 
-        client = self.get_client()
+        self.index_search_records(entity_type, {id_: search_data}, search_schema)
 
-        # TODO: looks like we can set uniqueKey via the API so index_id can not be
-        # used by solr by default. It uses "id". This is probably fine™ if using UUID
-        # (barring uuid clashes) for single sites but it might cause issues if users
-        # use custom ids or using the same db on two sites
-        # (for testing or development)
-        search_data["index_id"] = hashlib.md5(
-            b"%s%s" % (id_.encode(), config["ckan.site_id"].encode())
-        ).hexdigest()
+    def index_search_records(
+        self,
+        entity_type: str,
+        records: dict[str, dict[str, str | list[str]]],
+        search_schema: SearchSchema,
+    ) -> None:
+
+        client = self._get_write_client()
+
+        docs = []
+        for id_, search_data in records.items():
+            # TODO: looks like we can set uniqueKey via the API so index_id can not be
+            # used by solr by default. It uses "id". This is probably fine™ if using
+            # UUID (barring uuid clashes) for single sites but it might cause issues
+            # if users use custom ids or using the same db on two sites
+            # (for testing or development)
+            search_data["index_id"] = self._get_index_id(id_)
+            docs.append(search_data)
+
+        batch_size = asint(config.get("ckan.search.solr.batch_size", 500))
+        commit_params = self._get_commit_params()
 
         try:
-            # TODO: commit
-            client.add(docs=[search_data])
+            for i in range(0, len(docs), batch_size):
+                client.add(docs=docs[i : i + batch_size], **commit_params)
         except pysolr.SolrError as e:
             msg = "Solr returned an error: {0}".format(
                 e.args[0][:1000]  # limit huge responses
             )
-            # TODO: custom exception
-            raise Exception(msg)
+            raise SearchProviderError(msg)
         except socket.error as e:
             assert client
             msg = "Could not connect to Solr using {0}: {1}".format(client.url, str(e))
             log.error(msg)
-            # TODO: custom exception
-            raise Exception(msg)
+            raise SearchProviderError(msg)
+
+    def delete_search_record(self, entity_type: str, id_: str) -> None:
+
+        self.delete_search_records(entity_type, [id_])
+
+    def delete_search_records(self, entity_type: str, ids: list[str]) -> None:
+
+        client = self._get_write_client()
+
+        index_ids = [self._get_index_id(id_) for id_ in ids]
+
+        batch_size = asint(config.get("ckan.search.solr.batch_size", 500))
+        commit_params = self._get_commit_params()
+        if commit_params.pop("commitWithin", None):
+            # pysolr's delete() does not support commitWithin, make the
+            # deletes visible right away instead
+            commit_params["softCommit"] = True
+
+        try:
+            for i in range(0, len(index_ids), batch_size):
+                # The terms query parser is not affected by the max boolean
+                # clauses limit
+                query = "{!terms f=index_id}" + ",".join(index_ids[i : i + batch_size])
+                client.delete(q=query, **commit_params)
+        except pysolr.SolrError as e:
+            msg = "Solr returned an error: {0}".format(e.args[0][:1000])
+            raise SearchProviderError(msg)
+        except socket.error as e:
+            msg = "Could not connect to Solr using {0}: {1}".format(client.url, str(e))
+            log.error(msg)
+            raise SearchProviderError(msg)
+
+    def begin_bulk_indexing(self) -> None:
+
+        # Don't commit after each request, just once at the end
+        self._bulk_indexing = True
+
+    def end_bulk_indexing(self) -> None:
+
+        self._bulk_indexing = False
+
+        client = self._get_write_client()
+        try:
+            client.commit()
+        except pysolr.SolrError as e:
+            raise SearchProviderError(f"Solr returned an error: {e.args[0][:1000]}")
+
+    def begin_shadow_rebuild(self) -> None:
+
+        admin_client = self.get_admin_client()
+        live_name = admin_client.core_name
+        timestamp = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
+
+        if admin_client.is_cloud():
+            # The URL must point to an alias, so it can be moved to the new
+            # collection. The new one uses the same configset, and therefore
+            # the same schema
+            aliases = admin_client.get_aliases()
+            if live_name not in aliases:
+                raise SearchProviderError(
+                    f"Shadow rebuilds in SolrCloud require '{live_name}' to be "
+                    "a collection alias"
+                )
+            self._shadow_previous = aliases[live_name].split(",")
+
+            current = admin_client.get_collection(self._shadow_previous[0])
+            shadow_name = f"{live_name}_{timestamp}"
+            admin_client.create_collection(
+                shadow_name,
+                **{
+                    "collection.configName": current["configName"],
+                    "numShards": len(current["shards"]),
+                    "replicationFactor": current.get("replicationFactor", 1),
+                },
+            )
+        else:
+            shadow_name = f"{live_name}_shadow"
+            if admin_client.get_core(shadow_name):
+                # Leftover from an interrupted rebuild
+                admin_client.unload_core(shadow_name)
+            admin_client.create_core(shadow_name)
+            admin_client.copy_schema(shadow_name)
+
+        log.info(f"Created Solr core '{shadow_name}' for shadow rebuild")
+
+        self._shadow_name = shadow_name
+
+    def end_shadow_rebuild(self, success: bool) -> None:
+
+        shadow_name = self._shadow_name
+        self._shadow_name = ""
+        self._shadow_client = None
+        if not shadow_name:
+            return
+
+        admin_client = self.get_admin_client()
+        live_name = admin_client.core_name
+        is_cloud = admin_client.is_cloud()
+
+        if not success:
+            if is_cloud:
+                admin_client.delete_collection(shadow_name)
+            else:
+                admin_client.unload_core(shadow_name)
+            log.warning(f"Shadow rebuild failed, deleted Solr core '{shadow_name}'")
+            return
+
+        # The records were committed at the end of the bulk indexing
+        if is_cloud:
+            admin_client.create_alias(live_name, shadow_name)
+            for name in self._shadow_previous:
+                admin_client.delete_collection(name)
+        else:
+            # After swapping, the shadow name points to the old core
+            admin_client.swap_cores(live_name, shadow_name)
+            admin_client.unload_core(shadow_name)
+
+        log.info(f"Solr core '{live_name}' now serves the rebuilt index")
 
     def search_query_schema(self) -> Schema:
         """
@@ -325,6 +762,8 @@ class SolrSearchProvider(SingletonPlugin):
         return_facets: bool = False,
         limit: int = 20,
         start: int = 0,
+        cursor: Optional[str] = None,
+        fields: Optional[list[str]] = None,
     ) -> Optional[SearchResults]:
 
         # Transform generic search params to Solr query params
@@ -342,10 +781,40 @@ class SolrSearchProvider(SingletonPlugin):
             "q": q,
             "df": df,
             "fq": fq,
+            "rows": limit,
+            "start": start,
         }
 
         solr_params["fq"] = self._filterop_to_solr_fq(filters, search_schema)
 
+        sort_fields = parse_sort(sort, search_schema)
+
+        if cursor:
+            # Deep paging with a cursor, which requires a tie-break on the
+            # uniqueKey. Solr cursor marks are already opaque strings, and
+            # "*" starts a new one
+            if not sort_fields:
+                sort_fields = [("score", "desc")]
+            if "id" not in [field for field, _ in sort_fields]:
+                sort_fields.append(("id", "asc"))
+            solr_params["cursorMark"] = cursor
+            solr_params["start"] = 0
+
+        if sort_fields:
+            solr_params["sort"] = self._sort_to_solr_sort(sort_fields)
+
+        stored_fields = False
+        if return_ids:
+            # Don't fetch and parse the stored data dicts
+            solr_params["fl"] = "id"
+        elif fields:
+            stored_fields = self._are_stored_as_is(fields, search_schema)
+            if stored_fields:
+                # The stored values can be returned without parsing the records
+                solr_params["fl"] = ",".join(fields)
+            else:
+                solr_params["fl"] = "validated_data_dict"
+
         # TODO: perm labels for arbitrary entities
 
         # TODO: handle perm labels
@@ -375,17 +844,86 @@ class SolrSearchProvider(SingletonPlugin):
         items = []
         for doc in solr_response.docs:
 
-            # TODO: return just ids, or arbitrary fields?
+            if return_ids:
+                items.append(doc["id"])
+                continue
+            elif stored_fields:
+                items.append({field: doc[field] for field in fields if field in doc})
+                continue
+
             # TODO allow to choose validated/not validated? i.e use_default_schema
-            items.append(json.loads(doc["validated_data_dict"]))
+            data = json.loads(doc["validated_data_dict"])
+            if fields:
+                data = {field: data[field] for field in fields if field in data}
+            items.append(data)
+
+        result = {"count": solr_response.hits, "results": items, "facets": {}}
+
+        if cursor:
+            # The cursor mark doesn't change once all records have been returned
+            next_cursor = solr_response.nextCursorMark
+            result["next_cursor"] = next_cursor if next_cursor != cursor else None
+
+        return result
+
+    def _are_stored_as_is(self, fields: list[str], search_schema: SearchSchema) -> bool:
+        """
+        Whether Solr returns the same values for these fields as the ones in
+        the records. Dates are normalized by Solr, and empty lists are not
+        stored for multivalued fields.
+        """
+        schema_fields = search_schema.get("fields", {})
+        for field in fields:
+            props = schema_fields.get(field)
+            if (
+                not props
+                or props["type"] == "date"
+                or props.get("multiple", False)
+                or not props.get("stored", True)
+            ):
+                return False
 
-        return {"count": solr_response.hits, "results": items, "facets": {}}
+        return True
+
+    def _sort_to_solr_sort(self, sort_fields: list[tuple[str, str]]) -> str:
+
+        return ",".join(f"{field} {direction}" for field, direction in sort_fields)
+
+    def indexed_records(
+        self, entity_type: str
+    ) -> Iterator[tuple[str, Optional[str]]]:
+
+        client = self.get_client()
+
+        batch_size = asint(config.get("ckan.search.solr.batch_size", 500))
+
+        # Deep paging with a cursor, which requires sorting on the uniqueKey
+        cursor = "*"
+        while True:
+            try:
+                results = client.search(
+                    "*:*",
+                    fq=f'entity_type:"{entity_type}"',
+                    fl="id,metadata_modified",
+                    sort="id asc",
+                    rows=batch_size,
+                    cursorMark=cursor,
+                )
+            except pysolr.SolrError as e:
+                raise SearchProviderError(f"Solr returned an error: {e.args[0][:1000]}")
+
+            for doc in results.docs:
+                yield doc["id"], doc.get("metadata_modified")
+
+            if results.nextCursorMark == cursor:
+                break
+            cursor = results.nextCursorMark
 
     def clear_index(self) -> None:
 
         client = self.get_client()
         try:
-            client.delete(q="*:*")
+            client.delete(q="*:*", commit=True)
             log.info("Cleared all documents in the search index")
 
         except pysolr.SolrError as e:
@@ -497,18 +1035,74 @@ class SolrSearchProvider(SingletonPlugin):
         # Escape quotes
         return value.replace('"', '\\"')
 
+    def _get_commit_params(self) -> dict[str, Any]:
+        """
+        Return the parameters that control how changes sent to Solr are
+        committed, based on the ckan.search.solr.commit config option:
+
+        * hard: hard commit after each request (default)
+        * soft: soft commit after each request
+        * within: ask Solr to commit within ckan.search.solr.commit_within ms
+        * none: rely on the autoCommit settings of the Solr core
+
+        During bulk indexing nothing is committed until the operation ends.
+        """
+        if self._bulk_indexing:
+            return {"commit": False}
+
+        strategy = config.get("ckan.search.solr.commit", "hard")
+        if strategy == "hard":
+            return {"commit": True}
+        elif strategy == "soft":
+            return {"commit": False, "softCommit": True}
+        elif strategy == "within":
+            commit_within = asint(config.get("ckan.search.solr.commit_within", 1000))
+            return {"commit": False, "commitWithin": commit_within}
+        elif strategy == "none":
+            return {"commit": False}
+
+        raise ValueError(f"Unknown Solr commit strategy: {strategy}")
+
+    def _get_index_id(self, id_: str) -> str:
+
+        return hashlib.md5(
+            b"%s%s" % (id_.encode(), config["ckan.site_id"].encode())
+        ).hexdigest()
+
     # Provider methods
 
+    def _get_write_client(self) -> pysolr.Solr:
+        """
+        Return the client for the shadow core during a shadow rebuild, or the
+        default client otherwise
+        """
+        if not self._shadow_name:
+            return self.get_client()
+
+        if self._shadow_client and self._shadow_client_pid == os.getpid():
+            return self._shadow_client
+
+        admin_client = self.get_admin_client()
+        self._shadow_client = pysolr.Solr(
+            f"{admin_client.solr_root_url}/{self._shadow_name}", always_commit=False
+        )
+        self._shadow_client_pid = os.getpid()
+
+        return self._shadow_client
+
     def get_client(self) -> pysolr.Solr:
 
-        if self._client:
+        # The client connection pool can't be shared with forked processes
+        if self._client and self._client_pid == os.getpid():
             return self._client
 
         # TODO: core in URL
 
         # TODO:
-        #   Check conf at startup, handle always_commit, timeout and auth
-        self._client = pysolr.Solr(config["ckan.search.solr.url"], always_commit=True)
+        #   Check conf at startup, handle timeout and auth
+        # Commits are handled explicitly, see _get_commit_params()
+        self._client = pysolr.Solr(config["ckan.search.solr.url"], always_commit=False)
+        self._client_pid = os.getpid()
 
         return self._client
 
@@ -1,8 +1,15 @@
-from typing import Optional
-from ckan.plugins import PluginImplementations
+import functools
+import hashlib
+import json
+import logging
+from typing import Any, Optional
+from ckan.plugins import PluginImplementations, SingletonPlugin
 from ckanext.search.interfaces import SearchSchema, ISearchProvider, ISearchFeature
 
 
+log = logging.getLogger(__name__)
+
+
 def merge_search_schemas(schemas: list[SearchSchema]) -> SearchSchema:
     """
     Merge multiple search schemas into one, ensuring fields with the same name
@@ -33,6 +40,11 @@ def merge_search_schemas(schemas: list[SearchSchema]) -> SearchSchema:
     return result
 
 
+# Fields added to the indexed records that are not part of the record data
+# returned in the search results
+INTERNAL_FIELDS = ("validated_data_dict", "permission_labels", "content_hash")
+
+
 DEFAULT_DATASET_SEARCH_SCHEMA: SearchSchema = {
     "version": 1,
     "fields": {
@@ -55,6 +67,7 @@ DEFAULT_DATASET_SEARCH_SCHEMA: SearchSchema = {
             "indexed": False,
             "stored": True,
         },
+        "content_hash": {"type": "string", "indexed": False, "stored": True},
         # TODO: nested fields (e.g. resources)
     },
 }
@@ -73,10 +86,12 @@ DEFAULT_ORGANIZATION_SEARCH_SCHEMA: SearchSchema = {
             "indexed": False,
             "stored": True,
         },
+        "content_hash": {"type": "string", "indexed": False, "stored": True},
     },
 }
 
 
+@functools.cache
 def get_search_schema(entity_type: Optional[str] = None) -> SearchSchema:
     search_schemas = [
         DEFAULT_DATASET_SEARCH_SCHEMA,
@@ -93,7 +108,59 @@ def get_search_schema(entity_type: Optional[str] = None) -> SearchSchema:
         return merge_search_schemas(search_schemas)
 
 
-def init_schema(provider_id: str | None = None):
+def get_schema_metadata(
+    provider_plugin: SingletonPlugin,
+    search_schema: SearchSchema,
+    feature_plugins: list[SingletonPlugin],
+) -> dict[str, Any]:
+    """
+    Return the schema metadata stored in the index of a provider: the
+    search schema, its provider specific translation and the schemas of the
+    search features, plus a fingerprint of all of them.
+    """
+    schema = {
+        "fields": search_schema.get("fields", {}),
+        "provider": provider_plugin.provider_schema(search_schema),
+        "features": {
+            type(plugin).__name__: plugin.search_schema() for plugin in feature_plugins
+        },
+    }
+    # Normalize so it compares equal to the one read back from the index
+    schema = json.loads(json.dumps(schema, sort_keys=True, default=str))
+
+    fingerprint = hashlib.sha1(
+        json.dumps(schema, sort_keys=True).encode()
+    ).hexdigest()
+
+    return {"fingerprint": fingerprint, "schema": schema}
+
+
+def diff_schema_metadata(old: dict[str, Any], new: dict[str, Any]) -> list[str]:
+    """
+    Return a line for each added (+), removed (-) or changed (~) field
+    between two versions of the schema metadata
+    """
+    old_schema = old.get("schema") or {}
+    new_schema = new.get("schema") or {}
+
+    lines = []
+    for section in sorted(set(old_schema) | set(new_schema)):
+        old_items = old_schema.get(section) or {}
+        new_items = new_schema.get(section) or {}
+        for key in sorted(set(old_items) | set(new_items)):
+            if key not in old_items:
+                lines.append(f"+ {section}.{key}: {new_items[key]}")
+            elif key not in new_items:
+                lines.append(f"- {section}.{key}: {old_items[key]}")
+            elif old_items[key] != new_items[key]:
+                lines.append(
+                    f"~ {section}.{key}: {old_items[key]} -> {new_items[key]}"
+                )
+
+    return lines
+
+
+def init_schema(provider_id: str | None = None, force: bool = False):
 
     from ckanext.search.index import _get_indexing_plugins
     # TODO: combine different entities, schemas provided by extensions
@@ -102,26 +169,53 @@ def init_schema(provider_id: str | None = None):
 
     combined_search_schema = get_search_schema()
 
-    provider_ids = []
-    # Search providers set things up first
-
     if provider_id:
         plugins = [
             plugin
             for plugin in PluginImplementations(ISearchProvider)
             if plugin.id == provider_id
         ]
-        provider_ids.append(provider_id)
     else:
         plugins = [plugin for plugin in _get_indexing_plugins()]
-        provider_ids = [p.id for p in plugins]
 
     for plugin in plugins:
-        plugin.initialize_search_provider(combined_search_schema, clear=False)
 
-    # Search feature plugins can add things later
-    for plugin in PluginImplementations(ISearchFeature):
-        if any(
-            provider_id in plugin.supported_providers() for provider_id in provider_ids
-        ):
+        feature_plugins = [
+            feature_plugin
+            for feature_plugin in PluginImplementations(ISearchFeature)
+            if plugin.id in feature_plugin.supported_providers()
+        ]
+
+        metadata = get_schema_metadata(plugin, combined_search_schema, feature_plugins)
+        stored_metadata = plugin.get_schema_metadata()
+
+        if stored_metadata and not force:
+            if stored_metadata.get("fingerprint") == metadata["fingerprint"]:
+                log.info(f"Schema for search provider '{plugin.id}' is up to date")
+                continue
+
+            changes = diff_schema_metadata(stored_metadata, metadata)
+            log.info(
+                f"Schema for search provider '{plugin.id}' changed:\n"
+                + "\n".join(changes)
+            )
+
+        # Let the provider send the changes of all plugins at once
+        plugin.begin_schema_update()
+        success = False
+        try:
+            # Search providers set things up first
             plugin.initialize_search_provider(combined_search_schema, clear=False)
+
+            # Search feature plugins can add things later
+            for feature_plugin in feature_plugins:
+                feature_plugin.initialize_search_provider(
+                    combined_search_schema, clear=False
+                )
+            success = True
+        finally:
+            plugin.end_schema_update(success)
+
+        # Only stored once everything was initialized, errors are raised
+        # before getting here so the next init tries again
+        plugin.set_schema_metadata(metadata)
@@ -4,10 +4,10 @@ from typing import Any
 
 from geomet import wkt
 
-from ckan.plugins import SingletonPlugin, implements
+from ckan.plugins import PluginImplementations, SingletonPlugin, implements
 from ckan.plugins.toolkit import Invalid, get_validator, config
 from ckan.types import Schema
-from ckanext.search.interfaces import ISearchFeature, SearchSchema
+from ckanext.search.interfaces import ISearchFeature, ISearchProvider, SearchSchema
 
 from ckanext.search.providers.solr import SolrSchema
 
@@ -39,6 +39,17 @@ def bbox_validator(value):
     return bbox
 
 
+def _get_solr_admin_client() -> SolrSchema:
+
+    # Reuse the client of the Solr provider, which already has the schema
+    # loaded if it was just initialized
+    for plugin in PluginImplementations(ISearchProvider):
+        if plugin.id == "solr":
+            return plugin.get_admin_client()
+
+    return SolrSchema(config["ckan.search.solr.url"])
+
+
 class SpatialSearch(SingletonPlugin):
     """
     Plugin that adds spatial search capabilities to CKAN search.
@@ -60,45 +71,36 @@ class SpatialSearch(SingletonPlugin):
 
         # TODO BBox fields
 
-        _admin_client = SolrSchema(config["ckan.search.solr.url"])
-
-        field_type = _admin_client.get_field_type("location_rpt")
-        if not field_type:
-            # TODO: allow customizing
-            field_type = {
-                "class": "solr.SpatialRecursivePrefixTreeFieldType",
-                "geo": "true",
-                "maxDistErr": "0.001",
-                "distErrPct": "0.025",
-                "distanceUnits": "kilometers",
-            }
-
-            _admin_client.add_field_type("location_rpt", **field_type)
-            log.info("Added field type 'location_rpt' to schema")
-
-        field = _admin_client.get_field("spatial_geom")
-        if field:
-            log.info("Field 'spatial_geom' exists and clear not provided, skipping")
-        else:
-
-            field = {
-                "indexed": True,
-                "stored": False,
-                "multiValued": True,
-            }
-
-            resp = _admin_client.add_field("spatial_geom", "location_rpt", **field)
-            if "error" in resp:
-                msg = ""
-                if "details" in resp["error"]:
-                    msg = resp["error"]["details"][0]["errorMessages"]
-                elif "msg" in resp["error"]:
-                    msg = resp["error"]["msg"][:1000]
-
-                log.warning(f'Error creating field "spatial_geom": {msg}')
+        admin_client = _get_solr_admin_client()
+
+        with admin_client.batch():
+            if not admin_client.get_field_type("location_rpt"):
+                # TODO: allow customizing
+                field_type = {
+                    "class": "solr.SpatialRecursivePrefixTreeFieldType",
+                    "geo": "true",
+                    "maxDistErr": "0.001",
+                    "distErrPct": "0.025",
+                    "distanceUnits": "kilometers",
+                }
+
+                admin_client.add_field_type("location_rpt", **field_type)
+                log.info("Adding field type 'location_rpt' to schema")
+
+            if admin_client.get_field("spatial_geom"):
+                log.info("Field 'spatial_geom' exists and clear not provided, skipping")
             else:
+
+                field = {
+                    "indexed": True,
+                    "stored": False,
+                    "multiValued": True,
+                }
+
+                admin_client.add_field("spatial_geom", "location_rpt", **field)
                 log.info(
-                    f"Added field 'spatial_geom' to index, with type location_rpt and params {field}"
+                    "Adding field 'spatial_geom' to index, with type location_rpt "
+                    f"and params {field}"
                 )
 
     def search_schema(self) -> SearchSchema:
@@ -0,0 +1,82 @@
+"""
+Parsing of the `sort` query param.
+
+Sort can be provided as a string with comma separated clauses (e.g.
+"metadata_modified desc, name asc") or as a list, where each item is either
+one of these clauses or a list with the field name and optionally the
+direction (e.g. [["metadata_modified", "desc"], ["name"]]).
+
+Only single valued fields that are not full text can be used to sort, as
+search engines can't sort on tokenized or multiple values. `score` can also
+be used to sort by relevance.
+"""
+from typing import Any, Optional
+
+from ckan.plugins.toolkit import ValidationError
+
+from ckanext.search.interfaces import SearchSchema
+
+
+ASC = "asc"
+DESC = "desc"
+
+SCORE = "score"
+
+
+def is_sortable(field: dict[str, Any]) -> bool:
+    """
+    Whether a field of the search schema can be used to sort
+    """
+    return (
+        field.get("type") != "text"
+        and not field.get("multiple", False)
+        and field.get("indexed", True)
+    )
+
+
+def parse_sort(
+    sort: Optional[str | list[Any]], search_schema: SearchSchema
+) -> list[tuple[str, str]]:
+    """
+    Parse the sort param into a list of (field, direction) tuples, where
+    direction is "asc" or "desc".
+
+    Raises ValidationError if the format is not valid or the fields can not be
+    used to sort.
+    """
+    if not sort:
+        return []
+
+    if isinstance(sort, str):
+        sort = sort.split(",")
+
+    fields = search_schema.get("fields", {})
+
+    errors = []
+    result = []
+    for clause in sort:
+        if isinstance(clause, str):
+            clause = clause.split()
+
+        if not isinstance(clause, (list, tuple)) or not 1 <= len(clause) <= 2:
+            errors.append(f"Invalid sort clause: {clause}")
+            continue
+
+        field_name = str(clause[0])
+        direction = str(clause[1]).lower() if len(clause) > 1 else ASC
+
+        if direction not in (ASC, DESC):
+            errors.append(f"Invalid sort direction for field {field_name}: {direction}")
+        if field_name == SCORE:
+            pass
+        elif field_name not in fields:
+            errors.append(f"Unknown sort field: {field_name}")
+        elif not is_sortable(fields[field_name]):
+            errors.append(f"Field can not be used to sort: {field_name}")
+
+        result.append((field_name, direction))
+
+    if errors:
+        raise ValidationError({"sort": errors})
+
+    return result
@@ -0,0 +1,96 @@
+"""
+Local SQLite spool for index and delete operations that could not be sent to
+the search providers, e.g. because the search backend was down.
+
+Only the last operation for each record is kept. Spooled operations are sent
+again with `ckan search replay` or, when using the queue, after the next
+successful flush.
+
+The spool is a file in ckan.search.storage_path, so it is local to each host.
+In sync mode operations are spooled by the web processes, and `replay` needs
+to run on every web host unless they share the storage path.
+"""
+import sqlite3
+import time
+from contextlib import closing
+
+from ckanext.search.storage import get_storage_path
+
+
+def _connect() -> sqlite3.Connection:
+
+    conn = sqlite3.connect(get_storage_path("spool.db"), timeout=30)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS operations (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity_type TEXT NOT NULL,
+            id TEXT NOT NULL,
+            operation TEXT NOT NULL,
+            created REAL NOT NULL,
+            UNIQUE (entity_type, id)
+        )
+        """
+    )
+    return conn
+
+
+def add(operations: dict[tuple[str, str], str]) -> None:
+    """
+    Store a set of operations, keyed by (entity_type, id), replacing any
+    existing operation for the same records
+    """
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO operations "
+            "(entity_type, id, operation, created) VALUES (?, ?, ?, ?)",
+            [
+                (entity_type, id_, operation, now)
+                for (entity_type, id_), operation in operations.items()
+            ],
+        )
+
+
+def take(limit: int) -> list[tuple[int, str, str, str]]:
+    """
+    Return the oldest `limit` operations as (seq, entity_type, id, operation)
+    tuples. They are not removed from the spool until `remove()` is called.
+    """
+    with closing(_connect()) as conn:
+        return conn.execute(
+            "SELECT seq, entity_type, id, operation FROM operations "
+            "ORDER BY seq LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+
+def remove(seqs: list[int]) -> None:
+    """
+    Remove operations once they have been sent. Rows are removed by sequence
+    number (never reused) so operations spooled again in the meantime for the
+    same records are kept.
+    """
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "DELETE FROM operations WHERE seq = ?", [(seq,) for seq in seqs]
+        )
+
+
+def discard(entity_type: str, ids: list[str]) -> None:
+    """
+    Remove any spooled operations for these records, e.g. because a newer
+    operation for them has been sent successfully and replaying the old ones
+    would undo it
+    """
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "DELETE FROM operations WHERE entity_type = ? AND id = ?",
+            [(entity_type, id_) for id_ in ids],
+        )
+
+
+def count() -> int:
+
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM operations").fetchone()[0]
@@ -0,0 +1,59 @@
+"""
+Local files used by the search extension, like rebuild checkpoints
+"""
+import json
+import os
+import tempfile
+from typing import Any, Optional
+
+from ckan.plugins.toolkit import config
+
+
+def get_storage_path(*parts: str) -> str:
+    """
+    Return the path of a file in the local storage folder, creating the folder
+    if needed. Defaults to a `search` folder in `ckan.storage_path`.
+    """
+    storage_path = config.get("ckan.search.storage_path") or os.path.join(
+        config.get("ckan.storage_path") or tempfile.gettempdir(), "search"
+    )
+    os.makedirs(storage_path, exist_ok=True)
+
+    return os.path.join(storage_path, *parts)
+
+
+def _get_checkpoint_path(entity_type: str) -> str:
+
+    return get_storage_path(f"rebuild_{entity_type}.json")
+
+
+def load_checkpoint(entity_type: str) -> Optional[dict[str, Any]]:
+    """
+    Return the rebuild checkpoint for the entity type, if there is one. It
+    contains the last id indexed (`last_id`), the ids that failed (`failed`),
+    the `since` parameter of the rebuild and whether it was `completed`.
+    """
+    try:
+        with open(_get_checkpoint_path(entity_type)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(entity_type: str, checkpoint: dict[str, Any]) -> None:
+
+    path = _get_checkpoint_path(entity_type)
+
+    # Write to a temp file first so an interrupted write never leaves a
+    # corrupted checkpoint behind
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def clear_checkpoint(entity_type: str) -> None:
+
+    try:
+        os.remove(_get_checkpoint_path(entity_type))
+    except FileNotFoundError:
+        pass
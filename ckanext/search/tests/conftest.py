@@ -4,7 +4,14 @@ import pytest
 
 
 from ckanext.search.interfaces import ISearchFeature, ISearchProvider
-from ckanext.search.index import clear_index
+from ckanext.search.index import clear_caches, clear_index
+from ckanext.search.logic import actions
+
+
+@pytest.fixture(autouse=True)
+def storage_path(ckan_config, monkeypatch, tmp_path):
+    """Keep the checkpoints, spool and hashes of each test apart."""
+    monkeypatch.setitem(ckan_config, "ckan.search.storage_path", str(tmp_path))
 
 
 @pytest.fixture
@@ -60,8 +67,47 @@ def mock_search_plugins():
 
         mock_plugin_implementations.side_effect = choose
 
+        actions.clear_caches()
+
         # Return the mocks so tests can access them for assertions
         yield {
             "provider": mock_provider,
             "feature": mock_feature,
         }
+
+        actions.clear_caches()
+
+
+class MockIndexingProvider:
+
+    id = "test-provider"
+
+    def __init__(self):
+        self.index_search_records = mock.MagicMock()
+        self.delete_search_records = mock.MagicMock()
+        self.indexed_records = mock.MagicMock(return_value=[])
+        self.begin_bulk_indexing = mock.MagicMock()
+        self.end_bulk_indexing = mock.MagicMock()
+        self.begin_shadow_rebuild = mock.MagicMock()
+        self.end_shadow_rebuild = mock.MagicMock()
+
+
+@pytest.fixture
+def mock_indexing_provider():
+    """Fixture that mocks the provider plugin used for indexing."""
+    mock_provider = MockIndexingProvider()
+
+    with mock.patch(
+        "ckanext.search.index.PluginImplementations"
+    ) as mock_plugin_implementations:
+
+        def choose(interface):
+            if interface == ISearchProvider:
+                return [mock_provider]
+            return []
+
+        mock_plugin_implementations.side_effect = choose
+
+        clear_caches()
+        yield mock_provider
+        clear_caches()
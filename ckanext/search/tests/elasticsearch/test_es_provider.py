@@ -1,7 +1,7 @@
 import datetime
 
 import pytest
-from ckan.plugins.toolkit import config
+from ckan.plugins.toolkit import ValidationError, config
 
 from ckanext.search.filters import FilterOp
 from ckanext.search.interfaces import SearchSchema
@@ -262,3 +262,35 @@ def test_filters_unknown_operator_defaults_to_term(esp):
 
     result = {"term": {"some_text_field": "some_value"}}
     assert esp._filterop_to_es_query(filters, SEARCH_SCHEMA) == result
+
+
+@pytest.mark.parametrize("refresh", ["true", "false", "wait_for"])
+def test_refresh_policy(esp, ckan_config, monkeypatch, refresh):
+    monkeypatch.setitem(ckan_config, "ckan.search.elasticsearch.refresh", refresh)
+
+    assert esp._get_refresh() == refresh
+
+
+def test_refresh_policy_bulk_indexing(esp, ckan_config, monkeypatch):
+    monkeypatch.setitem(ckan_config, "ckan.search.elasticsearch.refresh", "true")
+    monkeypatch.setattr(esp, "_bulk_indexing", True)
+
+    assert esp._get_refresh() == "false"
+
+
+def test_refresh_policy_unknown(esp, ckan_config, monkeypatch):
+    monkeypatch.setitem(ckan_config, "ckan.search.elasticsearch.refresh", "always")
+
+    with pytest.raises(ValueError):
+        esp._get_refresh()
+
+
+def test_cursor_encoding(esp):
+    cursor = esp._encode_cursor("some-pit-id", ["2024-01-01", 3])
+
+    assert esp._decode_cursor(cursor) == ("some-pit-id", ["2024-01-01", 3])
+
+
+def test_invalid_cursor(esp):
+    with pytest.raises(ValidationError):
+        esp._decode_cursor("not-a-cursor")
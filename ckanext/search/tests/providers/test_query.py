@@ -1,7 +1,11 @@
+import json
+
 import pytest
 
 from ckan.plugins.toolkit import config
+from ckanext.search import index
 from ckanext.search.logic.actions import search as search_action
+from ckanext.search.logic.actions import export_records
 from ckanext.search.tests import factories
 
 pytestmark = [
@@ -60,3 +64,74 @@ def test_search_organization_combined_field(field_name, field_value):
     assert result["count"] == 1
     assert result["results"][0]["id"] == organization["id"]
     assert result["results"][0][field_name] == field_value
+
+
+def test_delete_records():
+
+    dataset1 = factories.IndexedDataset()
+    dataset2 = factories.IndexedDataset()
+    organization = factories.IndexedOrganization()
+
+    index.delete_datasets([dataset1["id"], "not-indexed"])
+    index.delete_organization(organization["id"])
+
+    result = search(q="*:*")
+
+    assert result["count"] == 1
+    assert result["results"][0]["id"] == dataset2["id"]
+
+
+def test_search_cursor():
+
+    datasets = [factories.IndexedDataset() for _ in range(5)]
+
+    ids = []
+    cursor = "*"
+    while cursor:
+        result = search(q="*:*", limit=2, cursor=cursor)
+        assert result["count"] == 5
+        ids.extend(record["id"] for record in result["results"])
+        cursor = result["next_cursor"]
+
+    assert sorted(ids) == sorted(dataset["id"] for dataset in datasets)
+
+
+@pytest.mark.ckan_config("ckan.search.export.batch_size", 2)
+def test_search_export():
+
+    datasets = [factories.IndexedDataset() for _ in range(5)]
+
+    context = {"ignore_auth": True}
+    lines = list(export_records(context, {"q": "*:*"}))
+
+    assert sorted(json.loads(line)["id"] for line in lines) == sorted(
+        dataset["id"] for dataset in datasets
+    )
+
+
+def test_search_return_ids():
+
+    dataset = factories.IndexedDataset()
+
+    result = search(q="*:*", return_ids=True)
+
+    assert result["count"] == 1
+    assert result["results"] == [dataset["id"]]
+
+
+@pytest.mark.parametrize(
+    "fields", [["title", "name"], ["title", "name", "metadata_modified", "tags"]]
+)
+def test_search_fields(fields):
+
+    dataset = factories.IndexedDataset(tags=[{"name": "walrus"}])
+
+    result = search(q="*:*", fields=fields)
+
+    record = result["results"][0]
+    assert list(record.keys()) == fields
+    for field in fields:
+        if field == "tags":
+            assert record["tags"] == ["walrus"]
+        else:
+            assert record[field] == dataset[field]
@@ -1,11 +1,12 @@
 import datetime
+from unittest import mock
 
 import pytest
 from ckan.plugins.toolkit import config
 
 from ckanext.search.filters import FilterOp
-from ckanext.search.interfaces import SearchSchema
-from ckanext.search.providers.solr import SolrSearchProvider
+from ckanext.search.interfaces import SearchProviderError, SearchSchema
+from ckanext.search.providers.solr import SolrSchema, SolrSearchProvider
 
 
 pytestmark = pytest.mark.skipif(
@@ -243,3 +244,259 @@ def test_filters_unknown_operator_defaults_to_equality(ssp):
 
     result = ['some_text_field:"some_value"']
     assert ssp._filterop_to_solr_fq(filters, SEARCH_SCHEMA) == result
+
+
+@pytest.mark.parametrize(
+    "strategy,params",
+    [
+        ("hard", {"commit": True}),
+        ("soft", {"commit": False, "softCommit": True}),
+        ("within", {"commit": False, "commitWithin": 1000}),
+        ("none", {"commit": False}),
+    ],
+)
+def test_commit_params(ssp, ckan_config, monkeypatch, strategy, params):
+    monkeypatch.setitem(ckan_config, "ckan.search.solr.commit", strategy)
+
+    assert ssp._get_commit_params() == params
+
+
+def test_commit_params_bulk_indexing(ssp, ckan_config, monkeypatch):
+    monkeypatch.setitem(ckan_config, "ckan.search.solr.commit", "hard")
+    monkeypatch.setattr(ssp, "_bulk_indexing", True)
+
+    assert ssp._get_commit_params() == {"commit": False}
+
+
+@pytest.mark.parametrize(
+    "strategy,params",
+    [
+        ("hard", {"commit": True}),
+        ("within", {"commit": False, "softCommit": True}),
+    ],
+)
+def test_delete_search_records(ssp, ckan_config, monkeypatch, strategy, params):
+    monkeypatch.setitem(ckan_config, "ckan.search.solr.commit", strategy)
+    client = mock.Mock()
+
+    with mock.patch.object(ssp, "_get_write_client", return_value=client):
+        ssp.delete_search_records("dataset", ["a", "b"])
+
+    index_ids = ",".join([ssp._get_index_id("a"), ssp._get_index_id("b")])
+    client.delete.assert_called_once_with(
+        q="{!terms f=index_id}" + index_ids, **params
+    )
+
+
+def test_copy_schema_sends_missing_definitions():
+    schemas = {
+        None: {
+            "fieldTypes": [{"name": "string"}, {"name": "text_en"}],
+            "fields": [{"name": "id"}, {"name": "title", "type": "text_en"}],
+            "copyFields": [{"source": "title", "dest": "text_combined"}],
+        },
+        "ckan_shadow": {
+            "fieldTypes": [{"name": "string"}],
+            "fields": [{"name": "id"}],
+        },
+    }
+    admin_client = SolrSchema("http://localhost:8983/solr/ckan")
+
+    def get_schema(core_name=None):
+        return schemas[core_name]
+
+    with mock.patch.object(
+        admin_client, "get_schema", side_effect=get_schema
+    ), mock.patch("ckanext.search.providers.solr.requests.post") as post:
+        admin_client.copy_schema("ckan_shadow")
+
+    post.assert_called_once_with(
+        "http://localhost:8983/solr/ckan_shadow/schema",
+        json={
+            "add-field-type": [{"name": "text_en"}],
+            "add-field": [{"name": "title", "type": "text_en"}],
+            "add-copy-field": [{"source": "title", "dest": "text_combined"}],
+        },
+    )
+
+
+def test_initialize_schema_sends_a_single_request(ssp):
+    admin_client = SolrSchema("http://localhost:8983/solr/ckan")
+    admin_client._schema = {"fields": [{"name": "id"}], "copyFields": []}
+
+    with mock.patch("ckanext.search.providers.solr.requests.post") as post:
+        post.return_value.json.return_value = {"responseHeader": {"status": 0}}
+        with admin_client.batch():
+            ssp._initialize_schema(admin_client, SEARCH_SCHEMA)
+
+    post.assert_called_once()
+    commands = post.call_args[1]["json"]
+    assert list(commands.keys()) == ["add-field", "add-copy-field"]
+    assert {"source": "some_text_field", "dest": "text_combined"} in commands[
+        "add-copy-field"
+    ]
+
+    # The local copy of the schema is updated, and the search schema is not
+    assert admin_client.get_field("some_text_field")["type"] == "text_en"
+    assert SEARCH_SCHEMA["fields"]["some_text_field"] == {"type": "text"}
+
+
+def test_nested_batches_send_a_single_request():
+    admin_client = SolrSchema("http://localhost:8983/solr/ckan")
+    admin_client._schema = {"fields": [{"name": "id"}], "copyFields": []}
+
+    with mock.patch("ckanext.search.providers.solr.requests.post") as post:
+        post.return_value.json.return_value = {"responseHeader": {"status": 0}}
+        admin_client.begin_batch()
+        with admin_client.batch():
+            admin_client.add_field("some_field", "string")
+        with admin_client.batch():
+            admin_client.add_field("other_field", "string")
+
+        post.assert_not_called()
+
+        admin_client.end_batch()
+
+    post.assert_called_once()
+    assert len(post.call_args[1]["json"]["add-field"]) == 2
+
+
+def test_batch_raises_on_errors():
+    admin_client = SolrSchema("http://localhost:8983/solr/ckan")
+    admin_client._schema = {"fields": [{"name": "id"}], "copyFields": []}
+
+    with mock.patch("ckanext.search.providers.solr.requests.post") as post:
+        post.return_value.json.return_value = {"error": {"msg": "Bad field"}}
+        with pytest.raises(SearchProviderError, match="Bad field"):
+            with admin_client.batch():
+                admin_client.add_field("some_field", "string")
+
+    # Nothing was applied
+    assert admin_client.get_field("some_field") is None
+
+
+def test_search_query_paging_and_sort(ssp):
+    client = mock.Mock()
+    client.search.return_value.docs = []
+    client.search.return_value.hits = 0
+
+    with mock.patch.object(ssp, "get_client", return_value=client):
+        ssp.search_query(
+            q="walrus",
+            filters=None,
+            sort=["some_date_field desc", ["score"]],
+            additional_params={},
+            lang="en",
+            search_schema=SEARCH_SCHEMA,
+            limit=5,
+            start=10,
+        )
+
+    solr_params = client.search.call_args[1]
+    assert solr_params["rows"] == 5
+    assert solr_params["start"] == 10
+    assert solr_params["sort"] == "some_date_field desc,score asc"
+
+
+def test_provider_schema_sortable_fields_get_doc_values(ssp):
+    fields = ssp.provider_schema(SEARCH_SCHEMA)
+
+    assert fields["some_date_field"]["docValues"] is True
+    assert "docValues" not in fields["some_text_field"]
+
+
+@pytest.mark.parametrize(
+    "next_cursor_mark,next_cursor", [("AoE1", "AoE1"), ("AoE0", None)]
+)
+def test_search_query_cursor(ssp, next_cursor_mark, next_cursor):
+    client = mock.Mock()
+    client.search.return_value.docs = []
+    client.search.return_value.hits = 0
+    client.search.return_value.nextCursorMark = next_cursor_mark
+
+    with mock.patch.object(ssp, "get_client", return_value=client):
+        result = ssp.search_query(
+            q="walrus",
+            filters=None,
+            sort=["some_date_field desc"],
+            additional_params={},
+            lang="en",
+            search_schema=SEARCH_SCHEMA,
+            start=10,
+            cursor="AoE0",
+        )
+
+    solr_params = client.search.call_args[1]
+    assert solr_params["cursorMark"] == "AoE0"
+    assert solr_params["start"] == 0
+    assert solr_params["sort"] == "some_date_field desc,id asc"
+    assert result["next_cursor"] == next_cursor
+
+
+def test_search_query_return_ids(ssp):
+    client = mock.Mock()
+    client.search.return_value.docs = [{"id": "a"}, {"id": "b"}]
+    client.search.return_value.hits = 2
+
+    with mock.patch.object(ssp, "get_client", return_value=client):
+        result = ssp.search_query(
+            q="walrus",
+            filters=None,
+            sort=None,
+            additional_params={},
+            lang="en",
+            search_schema=SEARCH_SCHEMA,
+            return_ids=True,
+        )
+
+    assert client.search.call_args[1]["fl"] == "id"
+    assert result["results"] == ["a", "b"]
+
+
+@pytest.mark.parametrize(
+    "fields,fl,doc,record",
+    [
+        (
+            ["some_text_field"],
+            "some_text_field",
+            {"some_text_field": "walrus"},
+            {"some_text_field": "walrus"},
+        ),
+        (
+            # Missing values are left out, same as when parsing the records
+            ["some_text_field", "some_numeric_field"],
+            "some_text_field,some_numeric_field",
+            {"some_text_field": "walrus"},
+            {"some_text_field": "walrus"},
+        ),
+        (
+            ["some_text_field", "some_date_field"],
+            "validated_data_dict",
+            {
+                "validated_data_dict": (
+                    '{"some_text_field": "walrus", '
+                    '"some_date_field": "2024-01-01T00:00:00", "other": 1}'
+                )
+            },
+            {"some_text_field": "walrus", "some_date_field": "2024-01-01T00:00:00"},
+        ),
+    ],
+)
+def test_search_query_fields(ssp, fields, fl, doc, record):
+    client = mock.Mock()
+    client.search.return_value.docs = [doc]
+    client.search.return_value.hits = 1
+
+    with mock.patch.object(ssp, "get_client", return_value=client):
+        result = ssp.search_query(
+            q="walrus",
+            filters=None,
+            sort=None,
+            additional_params={},
+            lang="en",
+            search_schema=SEARCH_SCHEMA,
+            fields=fields,
+        )
+
+    assert client.search.call_args[1]["fl"] == fl
+    assert result["results"] == [record]
@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 
 import ckan.plugins as plugins
@@ -5,6 +7,7 @@ from ckan.plugins import toolkit
 from ckan.tests import helpers
 
 from ckanext.search.filters import FilterOp
+from ckanext.search.logic import actions
 
 
 pytestmark = [
@@ -75,6 +78,53 @@ def test_standard_params_are_validated(mock_search_plugins):
     # assert exc_info.value.error_dict["sort"][0] == "Could not parse as valid JSON"
 
 
+def test_return_ids_param(mock_search_plugins):
+    helpers.call_action("search", q="cats")
+
+    query_params = mock_search_plugins["provider"].search_query.call_args[1]
+    assert query_params["return_ids"] is False
+
+    helpers.call_action("search", q="cats", return_ids="true")
+
+    query_params = mock_search_plugins["provider"].search_query.call_args[1]
+    assert query_params["return_ids"] is True
+
+
+@pytest.mark.parametrize(
+    "fields", ["title,name", " title , name", '["title", "name"]', ["title", "name"]]
+)
+def test_fields_param(mock_search_plugins, fields):
+    helpers.call_action("search", q="cats", fields=fields)
+
+    query_params = mock_search_plugins["provider"].search_query.call_args[1]
+    assert query_params["fields"] == ["title", "name"]
+
+
+def test_fields_param_internal_fields_fail(mock_search_plugins):
+
+    with pytest.raises(toolkit.ValidationError) as exc_info:
+        helpers.call_action("search", q="cats", fields="title,permission_labels")
+
+    assert exc_info.value.error_dict["fields"] == [
+        "Field can not be returned: permission_labels"
+    ]
+
+
+def test_cursor_param(mock_search_plugins):
+    helpers.call_action("search", q="cats", cursor="*")
+
+    query_params = mock_search_plugins["provider"].search_query.call_args[1]
+    assert query_params["cursor"] == "*"
+
+
+def test_cursor_param_with_start_fails(mock_search_plugins):
+
+    with pytest.raises(toolkit.ValidationError) as exc_info:
+        helpers.call_action("search", q="cats", cursor="*", start=10)
+
+    assert exc_info.value.error_dict["cursor"] == ["Can not be used with start"]
+
+
 def test_provider_params(mock_search_plugins):
     helpers.call_action(
         "search",
@@ -112,3 +162,46 @@ def test_unknown_params_fail(mock_search_plugins):
         )
 
     assert exc_info.value.error_dict["message"] == "Unknown parameters: not_, known"
+
+
+def test_query_schemas_are_cached(mock_search_plugins):
+    mock_search_plugins["provider"].search_query_schema = lambda: {"qf": []}
+
+    helpers.call_action("search", q="cats", qf="title^4.0")
+
+    # Changes in the plugins are not picked up until they are reloaded
+    mock_search_plugins["provider"].search_query_schema = lambda: {"df": []}
+
+    helpers.call_action("search", q="cats", qf="title^4.0")
+
+    actions.clear_caches()
+
+    with pytest.raises(toolkit.ValidationError):
+        helpers.call_action("search", q="cats", qf="title^4.0")
+
+
+def test_search_export(mock_search_plugins):
+    search_query = mock.MagicMock(
+        side_effect=[
+            {"count": 3, "results": [{"id": "a"}, {"id": "b"}], "next_cursor": "c1"},
+            {"count": 3, "results": [{"id": "c"}], "next_cursor": None},
+        ]
+    )
+    mock_search_plugins["provider"].search_query = search_query
+
+    records = actions.export_records({"ignore_auth": True}, {"q": "cats"})
+
+    # Nothing is queried until the records are consumed
+    search_query.assert_not_called()
+
+    assert list(records) == ['{"id": "a"}\n', '{"id": "b"}\n', '{"id": "c"}\n']
+    assert [c[1]["cursor"] for c in search_query.call_args_list] == ["*", "c1"]
+    assert search_query.call_args[1]["q"] == "cats"
+
+
+def test_search_export_paging_params_fail(mock_search_plugins):
+
+    with pytest.raises(toolkit.ValidationError) as exc_info:
+        actions.export_records({"ignore_auth": True}, {"q": "cats", "start": 10})
+
+    assert exc_info.value.error_dict == {"start": ["Not supported when exporting"]}
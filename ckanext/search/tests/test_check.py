@@ -0,0 +1,108 @@
+import datetime
+from unittest import mock
+
+import pytest
+
+from ckan.tests import factories
+
+from ckanext.search import check
+
+
+def test_diff_records():
+    modified = datetime.datetime(2024, 1, 1)
+    db_records = [("a", modified), ("b", modified), ("c", modified), ("e", None)]
+    index_records = [
+        ("b", modified),
+        ("c", datetime.datetime(2023, 1, 1)),
+        ("d", modified),
+        ("e", None),
+        ("f", None),
+    ]
+
+    assert list(check.diff_records(db_records, index_records)) == [
+        ("a", check.MISSING),
+        ("c", check.STALE),
+        ("d", check.ORPHAN),
+        ("f", check.ORPHAN),
+    ]
+
+
+def test_normalize_modified():
+    expected = datetime.datetime(2024, 1, 1, 10, 30, 0, 123000)
+
+    assert check._normalize_modified("2024-01-01T10:30:00.123Z") == expected
+    assert check._normalize_modified("2024-01-01T10:30:00.123456") == expected
+    assert (
+        check._normalize_modified(datetime.datetime(2024, 1, 1, 10, 30, 0, 123456))
+        == expected
+    )
+    assert check._normalize_modified("2024-01-01T10:30:00.12Z") == expected.replace(
+        microsecond=120000
+    )
+    assert check._normalize_modified(None) is None
+
+
+def test_feature_record_ids_must_be_sorted():
+    feature = mock.Mock()
+    feature.entity_types.return_value = ["custom"]
+    feature.existing_record_ids.return_value = iter(["a", "c", "b"])
+
+    with mock.patch.object(check, "PluginImplementations", return_value=[feature]):
+        records = check._database_records("custom")
+
+        assert next(records) == ("a", None)
+        assert next(records) == ("c", None)
+        with pytest.raises(ValueError, match="not sorted"):
+            next(records)
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+@pytest.mark.ckan_config("ckan.search.search_provider", "test-provider")
+def test_check_index(mock_indexing_provider):
+    up_to_date = factories.Dataset()
+    outdated = factories.Dataset()
+    missing = factories.Dataset()
+    mock_indexing_provider.indexed_records.return_value = sorted(
+        [
+            (up_to_date["id"], up_to_date["metadata_modified"]),
+            (outdated["id"], "2020-01-01T00:00:00Z"),
+            ("orphan-id", "2020-01-01T00:00:00Z"),
+        ]
+    )
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    counts, failed = check.check_index("dataset")
+
+    assert counts == {check.MISSING: 1, check.STALE: 1, check.ORPHAN: 1}
+    assert failed == []
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert set(records.keys()) == {outdated["id"], missing["id"]}
+    mock_indexing_provider.delete_search_records.assert_called_once_with(
+        "dataset", ["orphan-id"]
+    )
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+@pytest.mark.ckan_config("ckan.search.search_provider", "test-provider")
+def test_check_index_dry_run(mock_indexing_provider):
+    factories.Dataset()
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    counts, _ = check.check_index("dataset", fix=False)
+
+    assert counts[check.MISSING] == 1
+    mock_indexing_provider.index_search_records.assert_not_called()
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+@pytest.mark.ckan_config("ckan.search.search_provider", "test-provider")
+def test_check_index_skips_providers_without_indexed_records(mock_indexing_provider):
+    factories.Dataset()
+    mock_indexing_provider.indexed_records.return_value = None
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    counts, failed = check.check_index("dataset")
+
+    assert counts == {check.MISSING: 0, check.STALE: 0, check.ORPHAN: 0}
+    assert failed == []
+    mock_indexing_provider.index_search_records.assert_not_called()
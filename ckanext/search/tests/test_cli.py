@@ -0,0 +1,45 @@
+import datetime
+from unittest import mock
+
+import pytest
+
+from ckan.cli.cli import ckan
+
+from ckanext.search import cli as search_cli
+
+
+pytestmark = [
+    pytest.mark.usefixtures("with_plugins", "clean_db"),
+    pytest.mark.ckan_config("ckan.search.search_provider", "test-provider"),
+]
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2024-01-01T10:30:00Z",
+        "2024-01-01T10:30:00+00:00",
+        "2024-01-01T12:30:00+02:00",
+        "2024-01-01T10:30:00",
+    ],
+)
+def test_rebuild_since(cli, mock_indexing_provider, value):
+
+    with mock.patch.object(
+        search_cli, "rebuild_dataset_index", return_value=[]
+    ) as rebuild_datasets, mock.patch.object(
+        search_cli, "rebuild_organization_index", return_value=[]
+    ):
+        result = cli.invoke(ckan, ["search", "rebuild", "--since", value])
+
+    assert result.exit_code == 0, result.output
+    assert rebuild_datasets.call_args[1]["since"] == datetime.datetime(
+        2024, 1, 1, 10, 30
+    )
+
+
+def test_rebuild_since_invalid(cli):
+    result = cli.invoke(ckan, ["search", "rebuild", "--since", "yesterday"])
+
+    assert result.exit_code != 0
+    assert "Invalid ISO 8601 timestamp" in result.output
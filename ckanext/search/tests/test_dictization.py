@@ -0,0 +1,30 @@
+import pytest
+
+from ckan.tests import factories, helpers
+
+from ckanext.search.dictization import show_datasets
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+def test_show_datasets_matches_package_show():
+    org = factories.Organization()
+    group = factories.Group()
+    dataset1 = factories.Dataset(
+        owner_org=org["id"],
+        groups=[{"name": group["name"]}],
+        tags=[{"name": "walrus"}, {"name": "penguin"}],
+        extras=[{"key": "some_key", "value": "some_value"}],
+        resources=[{"url": "http://example.com/a"}, {"url": "http://example.com/b"}],
+    )
+    dataset2 = factories.Dataset()
+
+    expected = [
+        helpers.call_action("package_show", id=dataset["id"])
+        for dataset in (dataset2, dataset1)
+    ]
+
+    result = show_datasets(
+        [dataset2["id"], "not-found", dataset1["id"]], {"ignore_auth": True}
+    )
+
+    assert result == expected
@@ -0,0 +1,369 @@
+import datetime
+from unittest import mock
+
+import pytest
+
+from ckan.tests import factories, helpers
+
+from ckanext.search import index
+from ckanext.search.interfaces import ISearchFeature
+from ckanext.search.storage import load_checkpoint, save_checkpoint
+
+
+pytestmark = [
+    pytest.mark.usefixtures("with_plugins", "clean_db"),
+    pytest.mark.ckan_config("ckan.search.search_provider", "test-provider"),
+]
+
+
+def test_index_datasets_sends_a_single_batch(mock_indexing_provider):
+    datasets = [factories.Dataset() for _ in range(3)]
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    index.index_datasets([d["id"] for d in datasets])
+
+    calls = mock_indexing_provider.index_search_records.call_args_list
+    assert len(calls) == 1
+
+    entity_type, records, _ = calls[0][0]
+    assert entity_type == "dataset"
+    assert set(records.keys()) == {d["id"] for d in datasets}
+    for id_, search_data in records.items():
+        assert search_data["id"] == id_
+        assert search_data["entity_type"] == "dataset"
+
+
+def test_indexing_plugins_are_cached(mock_indexing_provider):
+    assert index._get_indexing_plugins() == (mock_indexing_provider,)
+
+    with mock.patch("ckanext.search.index.PluginImplementations", return_value=[]):
+        assert index._get_indexing_plugins() == (mock_indexing_provider,)
+
+        index.clear_caches()
+
+        assert index._get_indexing_plugins() == ()
+
+
+@pytest.mark.ckan_config("ckan.search.indexing_batch_size", 2)
+def test_rebuild_dataset_index_is_batched(mock_indexing_provider):
+    datasets = [factories.Dataset() for _ in range(3)]
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    index.rebuild_dataset_index()
+
+    calls = mock_indexing_provider.index_search_records.call_args_list
+    assert [len(c[0][1]) for c in calls] == [2, 1]
+
+    indexed_ids = set()
+    for c in calls:
+        indexed_ids.update(c[0][1].keys())
+    assert indexed_ids == {d["id"] for d in datasets}
+
+
+@pytest.mark.ckan_config("ckan.search.indexing_batch_size", 2)
+def test_rebuild_dataset_index_streams_ids_in_order(mock_indexing_provider):
+    datasets = [factories.Dataset() for _ in range(5)]
+    factories.Dataset(state="deleted")
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    index.rebuild_dataset_index()
+
+    indexed_ids = []
+    for c in mock_indexing_provider.index_search_records.call_args_list:
+        indexed_ids.extend(c[0][1].keys())
+
+    assert indexed_ids == sorted(d["id"] for d in datasets)
+
+
+def test_rebuild_dataset_index_returns_failed_ids(mock_indexing_provider):
+    dataset1 = factories.Dataset()
+    dataset2 = factories.Dataset()
+
+    def index_search_records(entity_type, records, search_schema):
+        if dataset2["id"] in records:
+            raise Exception("Could not index")
+
+    mock_indexing_provider.index_search_records.side_effect = index_search_records
+
+    failed = index.rebuild_dataset_index()
+
+    assert failed == [dataset2["id"]]
+    calls = mock_indexing_provider.index_search_records.call_args_list
+    assert [dataset1["id"]] in [list(c[0][1].keys()) for c in calls]
+
+
+@pytest.mark.ckan_config("ckan.search.indexing_batch_size", 2)
+def test_rebuild_dataset_index_workers(mock_indexing_provider, tmp_path):
+    datasets = [factories.Dataset() for _ in range(7)]
+    ids = sorted(d["id"] for d in datasets)
+    failing_id = ids[3]
+
+    # Records are indexed in the worker processes, so the mock calls are not
+    # seen by the parent
+    indexed_path = tmp_path / "indexed.txt"
+
+    def index_search_records(entity_type, records, search_schema):
+        if failing_id in records:
+            raise Exception("Could not index")
+        with open(indexed_path, "a") as f:
+            f.write("".join(f"{id_}\n" for id_ in records))
+
+    mock_indexing_provider.index_search_records.side_effect = index_search_records
+
+    failed = index.rebuild_dataset_index(workers=2)
+
+    assert failed == [failing_id]
+    indexed = indexed_path.read_text().split()
+    assert sorted(indexed) == [id_ for id_ in ids if id_ != failing_id]
+    assert load_checkpoint("dataset") == {
+        "last_id": ids[-1],
+        "failed": [failing_id],
+        "since": None,
+        "completed": True,
+    }
+
+
+def test_index_datasets_permission_labels(mock_indexing_provider):
+    org = factories.Organization()
+    public_dataset = factories.Dataset(owner_org=org["id"])
+    private_dataset = factories.Dataset(owner_org=org["id"], private=True)
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    index.index_datasets([public_dataset["id"], private_dataset["id"]])
+
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert records[public_dataset["id"]]["permission_labels"] == ["public"]
+    assert f"member-{org['id']}" in records[private_dataset["id"]]["permission_labels"]
+
+
+def test_rebuild_dataset_index_since(mock_indexing_provider):
+    factories.Dataset()
+    since = datetime.datetime.utcnow()
+    dataset = factories.Dataset()
+    deleted_dataset = factories.Dataset()
+    helpers.call_action("package_delete", id=deleted_dataset["id"])
+    mock_indexing_provider.index_search_records.reset_mock()
+    mock_indexing_provider.delete_search_records.reset_mock()
+
+    index.rebuild_dataset_index(since=since)
+
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert list(records.keys()) == [dataset["id"]]
+    # Left to `ckan search check`, rather than going through all deleted ones
+    mock_indexing_provider.delete_search_records.assert_not_called()
+
+
+def test_rebuild_does_not_change_index_settings(mock_indexing_provider):
+    factories.Dataset()
+
+    index.rebuild_dataset_index(since=datetime.datetime.utcnow())
+    index.rebuild_dataset_index()
+
+    # Left to the callers, only for full rebuilds
+    mock_indexing_provider.begin_bulk_indexing.assert_not_called()
+
+
+def test_rebuild_watermark():
+    assert index.get_rebuild_watermark() is None
+
+    now = datetime.datetime.utcnow()
+    index.set_rebuild_watermark(now)
+
+    assert index.get_rebuild_watermark() == now
+
+
+def test_rebuild_dataset_index_resume(mock_indexing_provider):
+    ids = sorted(factories.Dataset()["id"] for _ in range(3))
+    save_checkpoint(
+        "dataset", {"last_id": ids[0], "failed": ["some-id"], "since": None}
+    )
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    failed = index.rebuild_dataset_index(resume=True)
+
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert list(records.keys()) == ids[1:]
+
+    # Failed ids are kept for --retry-failed
+    assert failed == ["some-id"]
+    assert load_checkpoint("dataset") == {
+        "last_id": ids[2],
+        "failed": ["some-id"],
+        "since": None,
+        "completed": True,
+    }
+
+
+def test_retry_failed_records(mock_indexing_provider):
+    dataset = factories.Dataset()
+    save_checkpoint(
+        "dataset",
+        {"last_id": None, "failed": [dataset["id"]], "since": None, "completed": True},
+    )
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    assert index.retry_failed_records("dataset") == []
+
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert list(records.keys()) == [dataset["id"]]
+    assert load_checkpoint("dataset") is None
+
+
+def test_retry_failed_records_keeps_interrupted_checkpoint(mock_indexing_provider):
+    dataset = factories.Dataset()
+    save_checkpoint(
+        "dataset", {"last_id": dataset["id"], "failed": [dataset["id"]], "since": None}
+    )
+
+    assert index.retry_failed_records("dataset") == []
+
+    # The rebuild didn't finish, so it can still be resumed
+    assert load_checkpoint("dataset") == {
+        "last_id": dataset["id"],
+        "failed": [],
+        "since": None,
+    }
+
+
+@pytest.mark.ckan_config("ckan.search.skip_unchanged", True)
+def test_index_skips_unchanged_records(mock_indexing_provider):
+    dataset = factories.Dataset()
+    index.index_dataset(dataset["id"])
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    index.index_dataset(dataset["id"])
+
+    mock_indexing_provider.index_search_records.assert_not_called()
+
+    helpers.call_action("package_patch", id=dataset["id"], title="Walrus")
+
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert records[dataset["id"]]["title"] == "Walrus"
+    assert records[dataset["id"]]["content_hash"]
+
+
+@pytest.mark.ckan_config("ckan.search.skip_unchanged", True)
+def test_index_force_sends_unchanged_records(mock_indexing_provider):
+    dataset = factories.Dataset()
+    index.index_dataset(dataset["id"])
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    index.rebuild_dataset_index(force=True)
+
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert list(records.keys()) == [dataset["id"]]
+
+
+@pytest.mark.ckan_config("ckan.search.skip_unchanged", True)
+@pytest.mark.ckan_config("ckan.search.indexing_provider", "test-provider other")
+def test_index_skips_unchanged_records_several_providers(mock_indexing_provider):
+    other_provider = mock.Mock(id="other")
+
+    def add_index_id(entity_type, records, search_schema):
+        # Like the Solr provider does
+        for search_data in records.values():
+            search_data["index_id"] = "some-index-id"
+
+    mock_indexing_provider.index_search_records.side_effect = add_index_id
+
+    def add_field(entity_type, id_, search_data, search_schema):
+        search_data["added"] = search_data.get("added", 0) + 1
+
+    feature = mock.Mock()
+    feature.supported_providers.return_value = ["test-provider", "other"]
+    feature.entity_types.return_value = ["dataset"]
+    feature.before_index.side_effect = add_field
+
+    def choose(interface):
+        if interface == ISearchFeature:
+            return [feature]
+        return [mock_indexing_provider, other_provider]
+
+    dataset = factories.Dataset()
+    with mock.patch("ckanext.search.index.PluginImplementations", side_effect=choose):
+        index.clear_caches()
+        index.index_dataset(dataset["id"])
+
+        records = other_provider.index_search_records.call_args[0][1]
+        assert records[dataset["id"]]["added"] == 1
+        assert "index_id" not in records[dataset["id"]]
+
+        mock_indexing_provider.index_search_records.reset_mock()
+        other_provider.index_search_records.reset_mock()
+
+        index.index_dataset(dataset["id"])
+        index.clear_caches()
+
+    mock_indexing_provider.index_search_records.assert_not_called()
+    other_provider.index_search_records.assert_not_called()
+
+
+def test_rebuild_shadow_index(mock_indexing_provider):
+    dataset = factories.Dataset()
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    failed = index.rebuild_shadow_index()
+
+    assert failed == []
+    mock_indexing_provider.begin_shadow_rebuild.assert_called_once()
+    mock_indexing_provider.end_shadow_rebuild.assert_called_once_with(True)
+    # Once for all entity types, and not for the catch-up pass
+    mock_indexing_provider.begin_bulk_indexing.assert_called_once()
+    mock_indexing_provider.end_bulk_indexing.assert_called_once()
+    records = mock_indexing_provider.index_search_records.call_args_list[0][0][1]
+    assert list(records.keys()) == [dataset["id"]]
+
+
+def test_rebuild_shadow_index_discarded_on_errors(mock_indexing_provider):
+    dataset = factories.Dataset()
+    mock_indexing_provider.index_search_records.side_effect = Exception("down")
+
+    failed = index.rebuild_shadow_index()
+
+    assert failed == [dataset["id"]]
+    mock_indexing_provider.end_shadow_rebuild.assert_called_once_with(False)
+
+
+def test_rebuild_shadow_index_does_not_save_checkpoints(mock_indexing_provider):
+    live_checkpoint = {"last_id": "some-id", "failed": ["other-id"], "since": None}
+    save_checkpoint("dataset", live_checkpoint)
+    factories.Dataset()
+    mock_indexing_provider.index_search_records.side_effect = Exception("down")
+
+    index.rebuild_shadow_index()
+
+    # The failed records belong to the discarded index, not the current one
+    assert load_checkpoint("dataset") == live_checkpoint
+    assert load_checkpoint("organization") is None
+
+
+def test_rebuild_shadow_index_catch_up_is_forced(mock_indexing_provider):
+
+    with mock.patch.object(
+        index, "rebuild_dataset_index", return_value=[]
+    ) as rebuild_datasets, mock.patch.object(
+        index, "rebuild_organization_index", return_value=[]
+    ):
+        index.rebuild_shadow_index()
+
+    # The catch-up pass can't rely on hashes stored for the previous index
+    assert len(rebuild_datasets.call_args_list) == 2
+    assert rebuild_datasets.call_args_list[1][1]["since"]
+    assert all(c[1]["force"] for c in rebuild_datasets.call_args_list)
+
+
+def test_rebuild_shadow_index_refuses_feature_entity_types(mock_indexing_provider):
+    feature = mock.Mock()
+    feature.supported_providers.return_value = [mock_indexing_provider.id]
+    feature.entity_types.return_value = ["dataset", "custom"]
+
+    def choose(interface):
+        if interface == ISearchFeature:
+            return [feature]
+        return [mock_indexing_provider]
+
+    with mock.patch("ckanext.search.index.PluginImplementations", side_effect=choose):
+        with pytest.raises(ValueError, match="custom"):
+            index.rebuild_shadow_index()
+
+    mock_indexing_provider.begin_shadow_rebuild.assert_not_called()
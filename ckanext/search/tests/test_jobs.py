@@ -0,0 +1,177 @@
+from unittest import mock
+
+import pytest
+
+from ckan import model
+from ckan.tests import factories, helpers
+
+from ckanext.search import jobs, spool
+from ckanext.search.interfaces import SearchProviderError
+
+
+pytestmark = [
+    pytest.mark.usefixtures("with_plugins", "clean_db", "clean_redis"),
+    pytest.mark.ckan_config("ckan.search.search_provider", "test-provider"),
+]
+
+
+def test_sync_mode_indexes_on_update(mock_indexing_provider):
+    dataset = factories.Dataset()
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    helpers.call_action("package_patch", id=dataset["id"], title="Walrus")
+
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert records[dataset["id"]]["title"] == "Walrus"
+
+
+@pytest.mark.parametrize("mode", ["sync", "queue"])
+@pytest.mark.ckan_config("ckan.search.queue.window", 0)
+def test_rolled_back_changes_are_not_indexed(
+    mock_indexing_provider, ckan_config, monkeypatch, mode
+):
+    monkeypatch.setitem(ckan_config, "ckan.search.indexing_mode", mode)
+    dataset = factories.Dataset()
+    mock_indexing_provider.index_search_records.reset_mock()
+
+    # The edit hook runs before the action commits
+    with mock.patch.object(model.repo, "commit", side_effect=Exception("DB error")):
+        with pytest.raises(Exception, match="DB error"):
+            helpers.call_action("package_patch", id=dataset["id"], title="Walrus")
+    model.Session.rollback()
+
+    model.Session.commit()
+    jobs.flush_queue()
+
+    mock_indexing_provider.index_search_records.assert_not_called()
+
+
+@pytest.mark.ckan_config("ckan.search.indexing_mode", "queue")
+@pytest.mark.ckan_config("ckan.search.queue.window", 0)
+def test_queue_mode_coalesces_updates(mock_indexing_provider):
+    dataset = factories.Dataset()
+    helpers.call_action("package_patch", id=dataset["id"], title="Walrus")
+    helpers.call_action("package_patch", id=dataset["id"], title="Penguin")
+
+    mock_indexing_provider.index_search_records.assert_not_called()
+
+    jobs.flush_queue()
+
+    mock_indexing_provider.index_search_records.assert_called_once()
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert records[dataset["id"]]["title"] == "Penguin"
+
+
+@pytest.mark.ckan_config("ckan.search.indexing_mode", "queue")
+@pytest.mark.ckan_config("ckan.search.queue.window", 0)
+def test_queue_mode_delete_replaces_index(mock_indexing_provider):
+    dataset = factories.Dataset()
+    helpers.call_action("package_delete", id=dataset["id"])
+
+    jobs.flush_queue()
+
+    mock_indexing_provider.index_search_records.assert_not_called()
+    mock_indexing_provider.delete_search_records.assert_called_once_with(
+        "dataset", [dataset["id"]]
+    )
+
+
+def test_failed_updates_are_spooled_and_replayed(mock_indexing_provider):
+    dataset = factories.Dataset()
+    mock_indexing_provider.index_search_records.side_effect = SearchProviderError()
+
+    helpers.call_action("package_patch", id=dataset["id"], title="Walrus")
+
+    assert spool.count() == 1
+
+    mock_indexing_provider.index_search_records.reset_mock(side_effect=True)
+
+    assert jobs.replay_spool() == 1
+
+    assert spool.count() == 0
+    records = mock_indexing_provider.index_search_records.call_args[0][1]
+    assert records[dataset["id"]]["title"] == "Walrus"
+
+
+def test_replay_keeps_operations_if_still_failing(mock_indexing_provider):
+    dataset = factories.Dataset()
+    mock_indexing_provider.delete_search_records.side_effect = SearchProviderError()
+
+    helpers.call_action("package_delete", id=dataset["id"])
+
+    assert jobs.replay_spool() == 0
+    assert spool.take(10)[0][1:] == ("dataset", dataset["id"], jobs.DELETE)
+
+
+def test_spool_keeps_last_operation():
+    spool.add({("dataset", "id1"): jobs.INDEX, ("dataset", "id2"): jobs.INDEX})
+    spool.add({("dataset", "id1"): jobs.DELETE})
+
+    assert [row[1:] for row in spool.take(10)] == [
+        ("dataset", "id2", jobs.INDEX),
+        ("dataset", "id1", jobs.DELETE),
+    ]
+
+
+def test_spooled_update_is_dropped_after_newer_delete(mock_indexing_provider):
+    dataset = factories.Dataset()
+    mock_indexing_provider.index_search_records.side_effect = SearchProviderError()
+
+    helpers.call_action("package_patch", id=dataset["id"], title="Walrus")
+
+    assert spool.count() == 1
+
+    mock_indexing_provider.index_search_records.reset_mock(side_effect=True)
+
+    helpers.call_action("package_delete", id=dataset["id"])
+
+    mock_indexing_provider.delete_search_records.assert_called_with(
+        "dataset", [dataset["id"]]
+    )
+    assert spool.count() == 0
+
+    assert jobs.replay_spool() == 0
+    mock_indexing_provider.index_search_records.assert_not_called()
+
+
+def test_replayed_update_of_deleted_dataset_is_a_delete(mock_indexing_provider):
+    dataset = factories.Dataset()
+    spool.add({("dataset", dataset["id"]): jobs.INDEX})
+
+    # Deleted without the search plugin being notified, e.g. directly in the DB
+    pkg = model.Package.get(dataset["id"])
+    pkg.state = "deleted"
+    model.Session.commit()
+    mock_indexing_provider.index_search_records.reset_mock()
+    mock_indexing_provider.delete_search_records.reset_mock()
+
+    assert jobs.replay_spool() == 1
+
+    mock_indexing_provider.index_search_records.assert_not_called()
+    mock_indexing_provider.delete_search_records.assert_called_once_with(
+        "dataset", [dataset["id"]]
+    )
+
+
+@pytest.mark.ckan_config("ckan.search.indexing_mode", "queue")
+@pytest.mark.ckan_config("ckan.search.queue.window", 0)
+def test_flush_queue_skips_failing_records(mock_indexing_provider):
+    good = factories.Dataset()
+    bad = factories.Dataset()
+    helpers.call_action("package_patch", id=good["id"], title="Walrus")
+    helpers.call_action("package_patch", id=bad["id"], title="Penguin")
+
+    def index_search_records(entity_type, records, search_schema):
+        if bad["id"] in records:
+            raise ValueError("Bad record")
+
+    mock_indexing_provider.index_search_records.side_effect = index_search_records
+
+    jobs.flush_queue()
+
+    indexed = [
+        list(c[0][1].keys())
+        for c in mock_indexing_provider.index_search_records.call_args_list
+    ]
+    assert [good["id"]] in indexed
+    assert spool.count() == 0
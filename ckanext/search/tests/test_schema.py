@@ -0,0 +1,113 @@
+from unittest import mock
+
+import pytest
+
+from ckanext.search import schema
+from ckanext.search.interfaces import SearchProviderError
+
+
+class MockProvider:
+
+    id = "test-provider"
+
+    def __init__(self):
+        self.initialize_search_provider = mock.MagicMock()
+        self.set_schema_metadata = mock.MagicMock()
+        self.get_schema_metadata = mock.MagicMock(return_value=None)
+        self.begin_schema_update = mock.MagicMock()
+        self.end_schema_update = mock.MagicMock()
+
+    def provider_schema(self, search_schema):
+        return {"some_field": {"type": "string"}}
+
+
+def _init_schema(provider, force=False):
+    with mock.patch(
+        "ckanext.search.index._get_indexing_plugins", return_value=[provider]
+    ), mock.patch("ckanext.search.schema.PluginImplementations", return_value=[]):
+        schema.init_schema(force=force)
+
+
+def test_schema_metadata_fingerprint():
+    provider = MockProvider()
+    search_schema = {"fields": {"some_field": {"type": "string"}}}
+
+    metadata = schema.get_schema_metadata(provider, search_schema, [])
+
+    assert metadata == schema.get_schema_metadata(provider, search_schema, [])
+
+    search_schema["fields"]["other_field"] = {"type": "text"}
+
+    assert (
+        schema.get_schema_metadata(provider, search_schema, [])["fingerprint"]
+        != metadata["fingerprint"]
+    )
+
+
+def test_diff_schema_metadata():
+    old = {
+        "schema": {
+            "fields": {"a": {"type": "string"}, "b": {"type": "string"}},
+        }
+    }
+    new = {
+        "schema": {
+            "fields": {"b": {"type": "text"}, "c": {"type": "string"}},
+        }
+    }
+
+    assert schema.diff_schema_metadata(old, new) == [
+        "- fields.a: {'type': 'string'}",
+        "~ fields.b: {'type': 'string'} -> {'type': 'text'}",
+        "+ fields.c: {'type': 'string'}",
+    ]
+
+
+def test_init_schema_stores_metadata():
+    provider = MockProvider()
+
+    _init_schema(provider)
+
+    provider.initialize_search_provider.assert_called_once()
+    provider.begin_schema_update.assert_called_once()
+    provider.end_schema_update.assert_called_once_with(True)
+    metadata = provider.set_schema_metadata.call_args[0][0]
+    assert metadata["fingerprint"]
+    assert metadata["schema"]["provider"] == {"some_field": {"type": "string"}}
+
+
+def test_init_schema_skipped_if_unchanged():
+    provider = MockProvider()
+    _init_schema(provider)
+    provider.get_schema_metadata.return_value = (
+        provider.set_schema_metadata.call_args[0][0]
+    )
+    provider.initialize_search_provider.reset_mock()
+
+    _init_schema(provider)
+
+    provider.initialize_search_provider.assert_not_called()
+
+
+def test_init_schema_force():
+    provider = MockProvider()
+    _init_schema(provider)
+    provider.get_schema_metadata.return_value = (
+        provider.set_schema_metadata.call_args[0][0]
+    )
+    provider.initialize_search_provider.reset_mock()
+
+    _init_schema(provider, force=True)
+
+    provider.initialize_search_provider.assert_called_once()
+
+
+def test_init_schema_metadata_not_stored_on_errors():
+    provider = MockProvider()
+    provider.initialize_search_provider.side_effect = SearchProviderError("Bad")
+
+    with pytest.raises(SearchProviderError):
+        _init_schema(provider)
+
+    provider.set_schema_metadata.assert_not_called()
+    provider.end_schema_update.assert_called_once_with(False)
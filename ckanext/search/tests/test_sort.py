@@ -0,0 +1,57 @@
+import pytest
+
+from ckan.plugins.toolkit import ValidationError
+
+from ckanext.search.sort import parse_sort
+
+
+SEARCH_SCHEMA = {
+    "fields": {
+        "title": {"type": "text"},
+        "name": {"type": "string"},
+        "tags": {"type": "string", "multiple": True},
+        "metadata_modified": {"type": "date"},
+    }
+}
+
+
+@pytest.mark.parametrize("sort", [None, "", []])
+def test_sort_empty(sort):
+    assert parse_sort(sort, SEARCH_SCHEMA) == []
+
+
+@pytest.mark.parametrize(
+    "sort",
+    [
+        "metadata_modified desc, name",
+        ["metadata_modified desc", "name asc"],
+        [["metadata_modified", "DESC"], ["name"]],
+    ],
+)
+def test_sort_formats(sort):
+    assert parse_sort(sort, SEARCH_SCHEMA) == [
+        ("metadata_modified", "desc"),
+        ("name", "asc"),
+    ]
+
+
+def test_sort_score():
+    assert parse_sort("score desc", SEARCH_SCHEMA) == [("score", "desc")]
+
+
+@pytest.mark.parametrize(
+    "sort,error",
+    [
+        ("unknown asc", "Unknown sort field: unknown"),
+        ("title asc", "Field can not be used to sort: title"),
+        ("tags asc", "Field can not be used to sort: tags"),
+        ("name up", "Invalid sort direction for field name: up"),
+        (["name asc desc"], "Invalid sort clause: ['name', 'asc', 'desc']"),
+        ([{"name": "asc"}], "Invalid sort clause: {'name': 'asc'}"),
+    ],
+)
+def test_sort_errors(sort, error):
+    with pytest.raises(ValidationError) as e:
+        parse_sort(sort, SEARCH_SCHEMA)
+
+    assert e.value.error_dict["sort"] == [error]
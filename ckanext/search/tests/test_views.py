@@ -0,0 +1,38 @@
+from unittest import mock
+
+import pytest
+
+
+pytestmark = [
+    pytest.mark.usefixtures("with_plugins"),
+    pytest.mark.ckan_config("ckan.search.search_provider", "test-provider"),
+]
+
+
+def test_export_is_not_an_action(app):
+    resp = app.get("/api/3/action/search_export", status=400)
+
+    assert resp.json["success"] is False
+
+
+def test_export_view(app, mock_search_plugins):
+    mock_search_plugins["provider"].search_query = mock.MagicMock(
+        side_effect=[
+            {"count": 2, "results": [{"id": "a"}], "next_cursor": "c1"},
+            {"count": 2, "results": [{"id": "b"}], "next_cursor": None},
+        ]
+    )
+
+    resp = app.get("/api/search/export", query_string={"q": "cats"})
+
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"].startswith("application/x-ndjson")
+    assert resp.get_data(as_text=True) == '{"id": "a"}\n{"id": "b"}\n'
+
+
+def test_export_view_validation_error(app, mock_search_plugins):
+    resp = app.get(
+        "/api/search/export", query_string={"q": "cats", "start": 10}, status=409
+    )
+
+    assert resp.json["error"] == {"start": ["Not supported when exporting"]}
@@ -0,0 +1,50 @@
+import json
+
+from flask import Blueprint, Response, stream_with_context
+
+from ckan.plugins.toolkit import (
+    NotAuthorized,
+    ValidationError,
+    current_user,
+    request,
+)
+
+from ckanext.search.logic.actions import export_records
+
+
+search = Blueprint("search", __name__)
+
+
+def export():
+    """
+    Stream all the records matching the query as NDJSON. Takes the same
+    params as the `search` action in the query string, except the paging
+    ones.
+    """
+    context = {"user": current_user.name, "auth_user_obj": current_user}
+    data_dict = request.args.to_dict()
+
+    try:
+        records = export_records(context, data_dict)
+    except NotAuthorized:
+        return _error_response({"message": "Not authorized"}, 403)
+    except ValidationError as e:
+        return _error_response(e.error_dict, 409)
+
+    return Response(stream_with_context(records), mimetype="application/x-ndjson")
+
+
+def _error_response(error: dict, status: int) -> Response:
+
+    return Response(
+        json.dumps({"success": False, "error": error}),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+search.add_url_rule("/api/search/export", view_func=export)
+
+
+def get_blueprints():
+    return [search]